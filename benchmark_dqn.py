@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the DQN training and inference hot paths of the slimevolley_dqn package
+Runs on CPU with fixed seeds and writes the results as JSON, so a run can be compared with an earlier one
+Each benchmark runs in its own process, so its peak RSS is that of the component and not of everything before it
+
+    python benchmark_dqn.py --output bench.json
+    python benchmark_dqn.py --only act_greedy replay --compare bench.json
+"""
+
+import os
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '-1') # CPU only, before tensorflow is imported
+
+import argparse
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import slimevolley_dqn as dqn
+
+"""# Measurement"""
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, includes earlier benchmarks run in the same process"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10 # Bytes on macOS, KiB on Linux
+
+def summarize(durations, unit, items_per_call=1):
+    """Latency percentiles in microseconds and throughput of a list of per call durations in seconds"""
+    durations = np.asarray(durations, dtype=np.float64)
+    total = durations.sum()
+    p50, p90, p99 = np.percentile(durations, [50, 90, 99]) * 1e6
+    return {'unit': unit,
+            'calls': len(durations),
+            'mean_us': durations.mean() * 1e6,
+            'p50_us': p50,
+            'p90_us': p90,
+            'p99_us': p99,
+            'per_sec': len(durations) * items_per_call / total if total > 0 else float('inf'),
+            'peak_rss_mb': peak_rss_mb()}
+
+def time_calls(fn, n, warmup=10):
+    """Call fn(i) n times after a warmup and return the duration of each call"""
+    for i in range(warmup):
+        fn(i)
+    durations = np.empty(n)
+    for i in range(n):
+        start = time.perf_counter()
+        fn(i)
+        durations[i] = time.perf_counter() - start
+    return durations
+
+def reseed(seed):
+    np.random.seed(seed)
+    random.seed(seed)
+    tf.random.set_seed(seed)
+
+class StepCounter:
+    """Env wrapper counting step calls, everything else is forwarded to the wrapped env"""
+    def __init__(self, env):
+        self.env = env
+        self.steps = 0
+
+    def step(self, *actions):
+        self.steps += 1
+        return self.env.step(*actions)
+
+    def __getattr__(self, name):
+        return getattr(self.env, name)
+
+def make_agent(n_envs=1, replay_memory=10000, batch_size=32, **options):
+    """Agent with the run_training hyperparameters, options are passed on to DQN"""
+    return dqn.DQN(agent_name='bench',
+                   state_space=12,
+                   action_space=8,
+                   epsilon_decay=0.9995,
+                   discount_rate=0.95,
+                   learning_rate=0.0001,
+                   min_step_to_learn=0,
+                   replay_memory=replay_memory,
+                   batch_size=batch_size,
+                   target_update_interval=1000,
+                   training_interval=10,
+                   n_envs=n_envs,
+                   **options)
+
+def fill_memory(memory, n, rng):
+    states = rng.standard_normal((n, 12)).astype(np.float32)
+    actions = rng.integers(0, 8, n)
+    rewards = rng.choice([-1.0, 0.0, 1.0], n, p=[0.01, 0.98, 0.01])
+    dones = rng.random(n) < 0.002
+    for i in range(n - 1):
+        memory.add(states[i], actions[i], rewards[i], states[i + 1], dones[i])
+
+"""# Benchmarks"""
+
+def bench_action_inverse(scale):
+    return summarize(time_calls(lambda i: dqn.action_inverse(i & 7), 100000 * scale), 'call')
+
+def bench_act_greedy(scale):
+    agent = make_agent()
+    states = np.random.default_rng(0).standard_normal((256, 1, 12)).astype(np.float32)
+    return summarize(time_calls(lambda i: agent.act_greedy(states[i & 255]), 1000 * scale), 'call')
+
+def bench_act_numpy_policy(scale, dtype='float16'):
+    """act_greedy of the exported NumPy policy, as frozen opponents run it"""
+    policy = dqn.NumpyPolicy.from_weights(make_agent().model.get_weights(), dtype)
+    states = np.random.default_rng(0).standard_normal((256, 1, 12)).astype(np.float32)
+    return summarize(time_calls(lambda i: policy.act_greedy(states[i & 255]), 1000 * scale), 'call')
+
+def bench_act_batch(scale, n_envs=8):
+    agent = make_agent(n_envs=n_envs)
+    agent.epsilon = 0 # Time the greedy pass every call
+    states = np.random.default_rng(0).standard_normal((256, n_envs, 12)).astype(np.float32)
+    return summarize(time_calls(lambda i: agent.act_batch(states[i & 255]), 1000 * scale), 'env step', n_envs)
+
+def bench_update_replay_memory(scale, prioritized_replay=False):
+    agent = make_agent(prioritized_replay=prioritized_replay)
+    rng = np.random.default_rng(0)
+    states = rng.standard_normal((4096, 12)).astype(np.float32)
+    actions = rng.integers(0, 8, 4096)
+    def add(i):
+        j = i & 4095
+        agent.update_replay_memory(states[j], actions[j], 0.0, states[(j + 1) & 4095], False)
+    return summarize(time_calls(add, 20000 * scale), 'transition')
+
+def bench_sample(scale, prioritized_replay=False):
+    agent = make_agent(prioritized_replay=prioritized_replay)
+    fill_memory(agent.memory, agent.memory.capacity, np.random.default_rng(0))
+    def sample(i):
+        idx = agent.memory.sample_indices(agent.batch_size)
+        agent.memory.get(idx)
+        agent.memory.importance_weights(idx)
+    return summarize(time_calls(sample, 5000 * scale), 'batch')
+
+def bench_sample_memmap(scale, replay_memory=1000000):
+    """Uniform sampling with read-ahead from a replay file larger than the default buffer"""
+    with tempfile.TemporaryDirectory() as directory:
+        agent = make_agent(replay_memory=replay_memory, replay_directory=directory)
+        memory = agent.memory
+        memory.states[:] = np.random.default_rng(0).standard_normal((memory.capacity, 12), dtype=np.float32)
+        memory.size = memory.capacity
+        def sample(i):
+            idx = memory.sample_indices(agent.batch_size)
+            memory.get(idx)
+        result = summarize(time_calls(sample, 5000 * scale), 'batch')
+        memory.close()
+    return result
+
+def bench_replay(scale, prioritized_replay=False, batch_size=32, gradient_steps=1):
+    """Replay calls, throughput counted in gradient updates"""
+    agent = make_agent(prioritized_replay=prioritized_replay, batch_size=batch_size, gradient_steps=gradient_steps)
+    fill_memory(agent.memory, agent.memory.capacity, np.random.default_rng(0))
+    return summarize(time_calls(lambda i: agent.replay(), 500 * scale), 'update', gradient_steps)
+
+def bench_rollout(kind, scale):
+    """Greedy agent against the random, baseline, own copy or best model opponent"""
+    agent = make_agent()
+    if kind == 'bestmodel':
+        env = dqn.SlimeVolleySelfPlayEnv()
+        env.best_model = make_agent().model
+    else:
+        env = dqn.make_env()
+    env.seed(dqn.seed)
+    env = StepCounter(env)
+    rng = random.Random(dqn.seed)
+    rollouts = {'random': lambda i: dqn.rollout_random(env, agent, rng=rng),
+                'baseline': lambda i: dqn.rollout_baseline(env, agent),
+                'agents': lambda i: dqn.rollout_agents(env, agent, agent),
+                'bestmodel': lambda i: dqn.rollout_bestmodel(env, agent, rng=rng)}
+    durations = time_calls(rollouts[kind], 2 * scale, warmup=0)
+    return summarize(durations, 'env step', env.steps / len(durations))
+
+def bench_env_step(scale):
+    """Reference gym env against its baseline policy, random actions"""
+    env = dqn.make_env()
+    env.seed(dqn.seed)
+    env.reset()
+    actions = np.random.default_rng(0).integers(0, 8, 256)
+    def step(i):
+        if env.step(dqn.action_inverse(actions[i & 255]))[2]:
+            env.reset()
+    return summarize(time_calls(step, 5000 * scale), 'env step')
+
+def bench_batch_env_step(scale, n_games=64):
+    """The same games in one BatchSlimeVolleyEnv, one call steps all of them"""
+    env = dqn.BatchSlimeVolleyEnv(n_games)
+    env.seed(dqn.seed)
+    env.reset()
+    actions = np.random.default_rng(0).integers(0, 8, (256, n_games))
+    def step(i):
+        dones = env.step(actions[i & 255])[2]
+        if np.any(dones):
+            env.reset(np.flatnonzero(dones))
+    return summarize(time_calls(step, 1000 * scale), 'env step', n_games)
+
+def bench_play_games(scale, n_games=100):
+    """Batched games between two agents, all games stepped together, one gym env per game"""
+    agent0, agent1 = make_agent(), make_agent()
+    envs = []
+    def make_env():
+        envs.append(StepCounter(dqn.make_env()))
+        return envs[-1]
+    start = time.perf_counter()
+    dqn.play_games(agent0, agent1, n_games * scale, make_env=make_env)
+    duration = time.perf_counter() - start
+    return summarize([duration], 'env step', sum(env.steps for env in envs))
+
+def bench_play_games_batched(scale, n_games=100):
+    """play_games on the default BatchSlimeVolleyEnv, throughput in games as env steps are not counted there"""
+    agent0, agent1 = make_agent(), make_agent()
+    start = time.perf_counter()
+    dqn.play_games(agent0, agent1, n_games * scale)
+    duration = time.perf_counter() - start
+    return summarize([duration], 'game', n_games * scale)
+
+def bench_run_training(scale):
+    """Short end to end run, max_steps is past the warmup so replay updates are included"""
+    with tempfile.TemporaryDirectory() as logdir:
+        start = time.perf_counter()
+        agents = dqn.run_training(selfplay_mode=False, N=1, max_steps=12000 * scale, logdir=logdir + '/')
+        duration = time.perf_counter() - start
+    return summarize([duration], 'env step', agents[0].step)
+
+BENCHMARKS = {
+    'action_inverse': bench_action_inverse,
+    'act_greedy': bench_act_greedy,
+    'act_numpy_policy': bench_act_numpy_policy,
+    'act_numpy_policy_int8': lambda scale: bench_act_numpy_policy(scale, 'int8'),
+    'act_batch_8': bench_act_batch,
+    'update_replay_memory': bench_update_replay_memory,
+    'update_replay_memory_prioritized': lambda scale: bench_update_replay_memory(scale, prioritized_replay=True),
+    'sample': bench_sample,
+    'sample_prioritized': lambda scale: bench_sample(scale, prioritized_replay=True),
+    'sample_memmap': bench_sample_memmap,
+    'replay': bench_replay,
+    'replay_prioritized': lambda scale: bench_replay(scale, prioritized_replay=True),
+    'replay_large_batch': lambda scale: bench_replay(scale, batch_size=256, gradient_steps=4),
+    'rollout_random': lambda scale: bench_rollout('random', scale),
+    'rollout_baseline': lambda scale: bench_rollout('baseline', scale),
+    'rollout_agents': lambda scale: bench_rollout('agents', scale),
+    'rollout_bestmodel': lambda scale: bench_rollout('bestmodel', scale),
+    'env_step': bench_env_step,
+    'batch_env_step_64': bench_batch_env_step,
+    'play_games': bench_play_games,
+    'play_games_batched': bench_play_games_batched,
+    'run_training': bench_run_training,
+}
+
+"""# Report"""
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'tensorflow': tf.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'seed': dqn.seed}
+
+def print_result(name, result):
+    print(f"{name:34s} {result['per_sec']:12.1f} {result['unit']}/s  "
+          f"p50 {result['p50_us']:10.1f}us  p90 {result['p90_us']:10.1f}us  p99 {result['p99_us']:10.1f}us  "
+          f"rss {result['peak_rss_mb']:7.1f}MB (+{result['rss_increase_mb']:.1f})")
+
+def compare(results, baseline, tolerance):
+    """Print the throughput ratio against a baseline run, return the names that got slower than tolerance allows"""
+    regressions = []
+    print(f"\nAgainst {baseline['meta'].get('commit', '')[:10]} ({baseline['meta'].get('time', '')})")
+    for name, result in results.items():
+        if name not in baseline['results']:
+            continue
+        ratio = result['per_sec'] / baseline['results'][name]['per_sec']
+        slower = ratio < 1 - tolerance
+        if slower:
+            regressions.append(name)
+        print(f"{name:34s} {ratio:6.2f}x{'  REGRESSION' if slower else ''}")
+    return regressions
+
+def run_in_subprocess(name, scale):
+    """Run one benchmark in a fresh interpreter and return its result"""
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'result.json')
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--only', name, '--scale', str(scale),
+                        '--output', output, '--in-process'], check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)['results'][name]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', default='bench_results.json', help='JSON file for the results')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='Benchmarks to run, default all')
+    parser.add_argument('--skip', nargs='+', default=[], choices=sorted(BENCHMARKS), help='Benchmarks to leave out')
+    parser.add_argument('--scale', type=int, default=1, help='Multiplier on the number of timed calls')
+    parser.add_argument('--compare', help='Earlier results JSON to compare throughput with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed throughput drop before reporting a regression')
+    parser.add_argument('--in-process', action='store_true',
+                        help='Run all benchmarks in this process, faster but peak RSS accumulates over the benchmarks')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        if name in args.skip:
+            continue
+        if args.in_process:
+            reseed(dqn.seed) # Each benchmark starts from the same state whatever ran before it
+            start_rss = peak_rss_mb()
+            results[name] = BENCHMARKS[name](args.scale)
+            results[name]['rss_increase_mb'] = results[name]['peak_rss_mb'] - start_rss # Over the imports and earlier benchmarks
+        else:
+            results[name] = run_in_subprocess(name, args.scale)
+        print_result(name, results[name])
+
+    with open(args.output, 'w') as f:
+        json.dump({'meta': environment_info(), 'results': results}, f, indent=2)
+    print(f'Results saved to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
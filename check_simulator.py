@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Parity check of BatchSlimeVolleyEnv against the reference slimevolleygym.SlimeVolleyEnv
+Steps one reference env per game next to the batched games with the same seeds and actions,
+and compares observations, rewards, dones and the info dict every step, exits with 1 on the first mismatch
+
+    python check_simulator.py
+    python check_simulator.py --games 16 --steps 20000 --opponent random
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+import slimevolley_dqn as dqn
+
+def compare(name, step, expected, actual, atol):
+    """Print and return whether the reference values expected and the batched values actual differ"""
+    expected = np.asarray(expected, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    if np.allclose(expected, actual, rtol=0, atol=atol):
+        return False
+    difference = np.abs(expected - actual).reshape(len(expected), -1)
+    rows = np.flatnonzero(np.any(difference > atol, axis=1))
+    print(f'MISMATCH {name} at step {step}, games {rows.tolist()}, max difference {difference.max():.3g}')
+    for i in rows[:3]:
+        print(f'  game {i} reference {expected[i]}')
+        print(f'  game {i} batched   {actual[i]}')
+    return True
+
+def check(n_games, steps, seed, opponent, atol):
+    """Step both simulators for steps frames, returns the number of finished episodes, or None on a mismatch"""
+    envs = [dqn.make_env() for _ in range(n_games)]
+    for j, env in enumerate(envs):
+        env.seed(seed + j)
+    batch = dqn.BatchSlimeVolleyEnv(n_games)
+    batch.seed(seed) # Game j gets seed + j
+
+    obs = np.array([env.reset() for env in envs])
+    if compare('reset obs', 0, obs, batch.reset(), atol):
+        return None
+
+    rng = np.random.default_rng(seed)
+    episodes = 0
+    for step in range(1, steps + 1):
+        actions = rng.integers(0, 8, n_games)
+        other_actions = rng.integers(0, 8, n_games) if opponent == 'random' else None
+        reference = []
+        for j, env in enumerate(envs):
+            other_action = None if other_actions is None else dqn.action_inverse(other_actions[j])
+            reference.append(env.step(dqn.action_inverse(actions[j]), other_action))
+        obs, rewards, dones, info = batch.step(actions, other_actions)
+
+        mismatch = compare('obs', step, [r[0] for r in reference], obs, atol)
+        mismatch |= compare('reward', step, [r[1] for r in reference], rewards, 0)
+        mismatch |= compare('done', step, [r[2] for r in reference], dones, 0)
+        for key in ('ale.lives', 'ale.otherLives', 'otherState'):
+            mismatch |= compare(key, step, [r[3][key] for r in reference], info[key], atol)
+        if mismatch:
+            return None
+
+        finished = np.flatnonzero(dones)
+        for j in finished:
+            envs[j].reset()
+        if len(finished):
+            batch.reset(finished)
+            episodes += len(finished)
+    return episodes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--games', type=int, default=8, help='Games stepped side by side')
+    parser.add_argument('--steps', type=int, default=6000, help='Frames per game, episodes restart when done')
+    parser.add_argument('--seed', type=int, default=dqn.seed, help='Seed of game 0, game j gets seed + j')
+    parser.add_argument('--opponent', choices=['baseline', 'random'], default='baseline',
+                        help='Left agent, the built in baseline policy or random actions passed to both simulators')
+    parser.add_argument('--atol', type=float, default=1e-9, help='Allowed absolute difference of observations')
+    args = parser.parse_args(argv)
+
+    np.random.seed(args.seed)
+    episodes = check(args.games, args.steps, args.seed, args.opponent, args.atol)
+    if episodes is None:
+        return 1
+    print(f'OK {args.games} games, {args.steps} steps, {episodes} episodes finished, opponent {args.opponent}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+DQN, DDQN and Dueling DQN with self play on SlimeVolley, split from slimevolley_dqn_selfplay_v3.ipynb
+Importing the package is cheap, each name below imports its module on first access,
+and TensorFlow, gym and slimevolleygym are only imported once they are used, see backends.py
+
+    python -m slimevolley_dqn train --selfplay
+"""
+
+import importlib
+
+# Public names by module
+_modules = {
+    'backends': ['LazyModule', 'make_env', 'seed', 'set_seeds', 'spawn_context', 'in_colab', 'mount_drive', 'tf', 'gym', 'slimevolleygym'],
+    'selfplay': ['SlimeVolleySelfPlayEnv'],
+    'simulator': ['ACTION_TABLE', 'BatchSlimeVolleyEnv', 'BatchSlimeVolleySelfPlayEnv'],
+    'wrappers': ['RollingStack', 'FrameSkipStack', 'wrap_env'],
+    'instrumentation': ['PhaseTimer', 'Profiler', 'format_profile', 'JsonlSink', 'CsvSink'],
+    'metrics': ['EpisodeLog', 'load_episode_log', 'load_episode_logs', 'rolling_stats', 'aggregate_runs', 'write_episode_log',
+                'convert_score_pickle'],
+    'opponents': ['OpponentPool'],
+    'replay': ['ReplayMemory', 'SumTree', 'PrioritizedReplayMemory', 'open_replay_columns', 'MemmapReplayMemory', 'NStepBuffer'],
+    'inference': ['compile_greedy_fn', 'greedy_actions', 'fold_q_network', 'NumpyPolicy', 'load_policy'],
+    'agent': ['build_q_network', 'build_dueling_q_network', 'DQN'],
+    'export': ['policy_agreement', 'export_policy', 'collect_states'],
+    'utils': ['action_inverse', 'SLIMEVOLLEY_OBS_LOW', 'SLIMEVOLLEY_OBS_HIGH', 'SLIMEVOLLEY_BINS', 'Discretizer'],
+    'training': ['train_one_episode', 'VecCollector', 'train', 'TRAINING_DEFAULTS', 'run_training'],
+    'actors': ['SharedArray', 'SharedReplayMemory', 'SharedWeights', 'ActorLearner'],
+    'checkpointing': ['Checkpointer'],
+    'evaluation': ['rollout_random', 'rollout_agents', 'rollout_baseline', 'rollout_bestmodel', 'print_evaluation',
+                   'evaluate_interim', 'evaluate_agents', 'evaluate_bestmodel', 'PolicySnapshot', 'EvalJob', 'EvalPool'],
+    'tournament': ['batch_policy', 'play_games', 'elo_ratings', 'round_robin', 'print_tournament'],
+    'experiments': ['sweep', 'ResultsStore', 'run_experiment', 'pin_threads', 'run_experiments', 'run_sweep'],
+}
+_name_module = {name: module for module, names in _modules.items() for name in names}
+
+__all__ = list(_name_module)
+
+def __getattr__(name):
+    if name not in _name_module:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module('.' + _name_module[name], __name__), name)
+    globals()[name] = value # Later lookups skip __getattr__
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
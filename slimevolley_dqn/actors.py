@@ -0,0 +1,321 @@
+"""# Actor/learner training"""
+
+import queue
+import random
+import time
+
+# For parallel actor/learner training
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .backends import make_env, selfplay, spawn_context
+from .evaluation import PolicySnapshot
+from .replay import MemmapReplayMemory, NStepBuffer, PrioritizedReplayMemory, ReplayMemory
+from .utils import action_inverse
+from .wrappers import wrap_env
+
+class SharedArray:
+    """
+    Numpy array in a named shared memory block, pickling it attaches to the same block
+    """
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None # Only the creating process unlinks the block
+        if self.owner:
+            nbytes = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def __reduce__(self):
+        return (SharedArray, (self.shape, self.dtype.str, self.shm.name))
+
+    def close(self):
+        self.array = None
+        try:
+            self.shm.close()
+        except BufferError: # Views still alive, the mapping goes away with the process
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+class SharedReplayMemory:
+    """
+    Replay memory in shared memory, split in one ring buffer segment per actor so writers never contend
+    Actors write through segment(i), the learner samples uniformly over all segments
+    """
+    def __init__(self, capacity, state_space, n_actors, n_step=1):
+        self.n_actors = n_actors
+        self.n_step = n_step # Next states n_step slots later, see ReplayMemory
+        self.segment_capacity = capacity // n_actors
+        total = self.segment_capacity * n_actors
+        self.shared = [SharedArray((total, state_space), np.float32),
+                       SharedArray((total,), np.uint8),
+                       SharedArray((total,), np.float32),
+                       SharedArray((total,), np.bool_)]
+        self.shared_meta = SharedArray((n_actors, 3), np.int64) # ptr, size, env steps per segment
+        self.stride = 1
+
+    @property
+    def meta(self):
+        return self.shared_meta.array
+
+    def segment(self, i):
+        """ReplayMemory writing into the slots of actor i, call commit after adding"""
+        block = slice(i * self.segment_capacity, (i + 1) * self.segment_capacity)
+        storage = tuple(shared.array[block] for shared in self.shared)
+        return ReplayMemory(self.segment_capacity, storage[0].shape[1], storage=storage, n_step=self.n_step)
+
+    def commit(self, i, segment):
+        # Written after the transition data, so the learner never samples unwritten slots
+        self.meta[i, 0] = segment.ptr
+        self.meta[i, 1] = segment.size
+        self.meta[i, 2] += 1
+
+    def env_steps(self):
+        return int(self.meta[:, 2].sum())
+
+    def __len__(self):
+        return int(self.meta[:, 1].sum())
+
+    def sample_indices(self, batch_size):
+        meta = self.meta.copy() # Consistent view while actors keep writing
+        ptr, size = meta[:, 0], meta[:, 1]
+        counts = np.minimum(size, self.segment_capacity - self.n_step) # The slots before ptr, see ReplayMemory.n_valid
+        ends = np.cumsum(counts)
+        
+        u = np.random.randint(0, ends[-1], size=batch_size)
+        seg = np.searchsorted(ends, u, side='right')
+        offsets = u - (ends[seg] - counts[seg])
+        local = (ptr[seg] - counts[seg] + offsets) % self.segment_capacity
+        return seg * self.segment_capacity + local
+
+    def get(self, idx):
+        cap = self.segment_capacity
+        next_idx = (idx // cap) * cap + (idx % cap + self.n_step) % cap
+        states, actions, rewards, dones = (shared.array for shared in self.shared)
+        return (states[idx], 
+                actions[idx], 
+                rewards[idx], 
+                states[next_idx], 
+                dones[idx])
+
+    # Uniform sampling like ReplayMemory
+    importance_weights = ReplayMemory.importance_weights
+    update_priorities = ReplayMemory.update_priorities
+
+    def close(self):
+        for shared in self.shared + [self.shared_meta]:
+            shared.close()
+
+class SharedWeights:
+    """
+    Network weights published by the learner to the actors through shared memory
+    A version counter that is odd while writing lets readers detect torn copies
+    """
+    def __init__(self, weights):
+        self.shapes = [w.shape for w in weights]
+        self.shared_data = SharedArray((sum(w.size for w in weights),), np.float32)
+        self.shared_header = SharedArray((2,), np.float64) # version, epsilon
+
+    def publish(self, weights, epsilon=0.0):
+        header = self.shared_header.array
+        header[0] += 1 # Odd, write in progress
+        self.shared_data.array[:] = np.concatenate([np.ravel(w) for w in weights])
+        header[1] = epsilon
+        header[0] += 1
+
+    def read(self, last_version=0):
+        """Return (version, weights, epsilon) if a newer complete version is published, else None"""
+        header = self.shared_header.array
+        version = int(header[0])
+        if version == last_version or version % 2 == 1:
+            return None
+        data = self.shared_data.array.copy()
+        epsilon = float(header[1])
+        if int(header[0]) != version:
+            return None
+        weights = []
+        start = 0
+        for shape in self.shapes:
+            size = int(np.prod(shape))
+            weights.append(data[start:start + size].reshape(shape))
+            start += size
+        return version, weights, epsilon
+
+    def close(self):
+        self.shared_data.close()
+        self.shared_header.close()
+
+def _actor_main(actor_id, replay, weights, opponent_weights, learner_updates, episodes, stop,
+                selfplay_mode, state_space, action_space, training_interval, max_updates_behind, actor_seed, dueling=False,
+                frame_skip=1, n_stack=1, n_step=1, gamma=0.95):
+    """
+    Actor process: run the epsilon greedy policy with the latest published weights and write transitions
+    Pauses while the learner is more than max_updates_behind updates behind the collected env steps
+    Exits when stop is set or the learner process is gone, which then never sets stop
+    """
+    env = wrap_env(selfplay.SlimeVolleySelfPlayEnv() if selfplay_mode else make_env(), frame_skip, n_stack)
+    env.seed(actor_seed)
+    np.random.seed(actor_seed)
+    random.seed(actor_seed)
+    
+    segment = replay.segment(actor_id)
+    n_step_buffer = NStepBuffer(n_step, gamma, state_space) if n_step > 1 else None
+    policy = PolicySnapshot(state_space, action_space, dueling)
+    opponent = PolicySnapshot(state_space, action_space, dueling)
+    version, opponent_version = 0, 0
+    epsilon = 1
+    learner = multiprocessing.parent_process()
+    running = lambda: not stop.is_set() and learner.is_alive()
+    
+    while running():
+        state = env.reset()
+        other_state = state
+        score = 0
+        length = 0
+        done = False
+        
+        while not done and running():
+            if replay.env_steps() >= (learner_updates.array[0] + max_updates_behind) * training_interval:
+                time.sleep(0.0005) # Keep the update to data ratio
+                continue
+            
+            published = weights.read(version)
+            if published is not None:
+                version, new_weights, epsilon = published
+                policy.load(version, new_weights)
+            if selfplay_mode:
+                published = opponent_weights.read(opponent_version)
+                if published is not None:
+                    opponent_version, new_weights, _ = published
+                    opponent.load(opponent_version, new_weights)
+                    env.best_model = opponent.model
+            
+            if np.random.rand() > epsilon: # Epsilon greedy policy
+                action = policy.act_greedy(state)
+            else:
+                action = policy.act_random()
+            
+            if selfplay_mode:
+                next_state, reward, done, info = env.step(action_inverse(action), action_inverse(env.predict(other_state)))
+            else:
+                next_state, reward, done, info = env.step(action_inverse(action))
+            
+            if n_step_buffer is None:
+                segment.add(state, action, reward, next_state, done)
+            else:
+                for transition in n_step_buffer.push(state, action, reward, next_state, done):
+                    segment.add(*transition)
+            replay.commit(actor_id, segment)
+            
+            score += reward
+            length += 1
+            state = next_state
+            other_state = info['otherObs']
+        
+        if done:
+            episodes.put((score, length))
+
+class ActorLearner:
+    """
+    Actor processes collect experience into shared replay while this process learns from it
+    Drop-in for VecCollector in train, agent.step counts the env steps of all actors
+    The learner runs one replay per agent.training_interval env steps, and publishes
+    weights and epsilon to the actors every weight_sync_interval updates,
+    actors wait when they get more than weight_sync_interval updates ahead of the learner
+    The shared replay is sampled uniformly from RAM, agents with prioritized or memmap replay are refused
+    """
+    def __init__(self, agent, n_actors, selfplay_mode=False, weight_sync_interval=10, seed=0, frame_skip=1, n_stack=1):
+        if isinstance(agent.memory, (PrioritizedReplayMemory, MemmapReplayMemory)):
+            raise ValueError(f'Actors write to a uniform shared replay in RAM, {type(agent.memory).__name__} is not supported, '
+                             'turn off prioritized and memmap replay or set n_actors = 0')
+        self.agent = agent
+        self.weight_sync_interval = weight_sync_interval
+        self.n_updates = 0
+        self.step_offset = agent.step # Env steps before the actors started, e.g. restored from a checkpoint
+        
+        self.replay = SharedReplayMemory(agent.memory.capacity, agent.state_space, n_actors, agent.n_step)
+        self.agent_memory = agent.memory # Given back by close, the shared replay is freed there
+        agent.memory = self.replay # The learner samples the shared replay
+        self.weights = SharedWeights(agent.model.get_weights())
+        self.opponent_weights = SharedWeights(agent.model.get_weights())
+        self.weights.publish(agent.model.get_weights(), agent.epsilon)
+        self.learner_updates = SharedArray((1,), np.int64)
+        
+        ctx = spawn_context()
+        self.episodes = ctx.Queue()
+        self.stop = ctx.Event()
+        self.actors = [ctx.Process(target=_actor_main, 
+                                   args=(i, self.replay, self.weights, self.opponent_weights, self.learner_updates, self.episodes, self.stop,
+                                         selfplay_mode, agent.state_space, agent.action_space, 
+                                         agent.training_interval, weight_sync_interval, seed + i, agent.dueling, frame_skip, n_stack,
+                                         agent.n_step, agent.gamma),
+                                   daemon=True)
+                       for i in range(n_actors)]
+        for actor in self.actors:
+            actor.start()
+
+    def drain_episodes(self):
+        finished = []
+        while True:
+            try:
+                finished.append(self.episodes.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def learn(self):
+        """Run the replay updates the actors' env steps allow, return number of updates done"""
+        agent = self.agent
+        step_before = agent.step
+        agent.step = self.step_offset + self.replay.env_steps()
+        
+        n = 0
+        while self.n_updates < (agent.step - self.step_offset) // agent.training_interval:
+            agent.replay()
+            self.n_updates += 1
+            n += 1
+            if self.n_updates % self.weight_sync_interval == 0:
+                self.weights.publish(agent.model.get_weights(), agent.epsilon)
+        self.learner_updates.array[0] = self.n_updates
+        
+        # Update target model after certain timesteps
+        if agent.step // agent.update_target_model_freq > step_before // agent.update_target_model_freq:
+            print(f'Target network update at step {agent.step}, epsilon {agent.epsilon}')
+            agent.update_target_model()
+        return n
+
+    def collect_episodes(self):
+        """Learn until at least one actor episode is done"""
+        finished = []
+        while not finished:
+            if self.learn() == 0:
+                time.sleep(0.001) # Wait for actors
+            finished = self.drain_episodes()
+        return finished
+
+    def set_best_model(self, model):
+        """Publish the weights of a keras model as the self play opponent of the actors"""
+        self.opponent_weights.publish(model.get_weights())
+
+    def close(self):
+        self.stop.set()
+        for actor in self.actors:
+            while actor.is_alive(): # Keep the queue drained so actors can exit
+                self.drain_episodes()
+                actor.join(timeout=0.1)
+        self.agent.memory = self.agent_memory
+        self.replay.close()
+        self.weights.close()
+        self.opponent_weights.close()
+        self.learner_updates.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
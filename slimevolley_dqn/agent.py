@@ -0,0 +1,305 @@
+"""# Agent class - DQN"""
+
+import random
+import time
+
+import numpy as np
+
+from .backends import tf
+from .inference import greedy_actions
+from .instrumentation import Profiler
+from .replay import MemmapReplayMemory, NStepBuffer, PrioritizedReplayMemory, ReplayMemory, open_replay_columns
+
+def build_q_network(state_space, action_space, learning_rate, dueling=False):
+    if dueling:
+        return build_dueling_q_network(state_space, action_space, learning_rate)
+    
+    # Architecture
+    model = tf.keras.Sequential()
+
+    model.add(tf.keras.layers.Dense(32, input_shape=(state_space,), activation='relu', 
+             kernel_initializer=tf.keras.initializers.VarianceScaling(
+             scale=2.0, mode='fan_in', distribution='truncated_normal'), 
+             name='dense1')) # Set input shape to initialize weights
+    model.add(tf.keras.layers.Dense(32, activation='relu',
+             kernel_initializer=tf.keras.initializers.VarianceScaling(
+             scale=2.0, mode='fan_in', distribution='truncated_normal'),
+             name='dense2'))
+    model.add(tf.keras.layers.Dense(action_space, activation='softmax', name='dense3'))
+    
+    model.compile(loss='mse', optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate))
+    
+    return model
+
+def build_dueling_q_network(state_space, action_space, learning_rate):
+    """
+    Dueling architecture, Wang et al. 2016, same hidden layers as build_q_network
+    Q(s,a) = V(s) + A(s,a) - mean over a of A(s,a)
+    """
+    inputs = tf.keras.Input(shape=(state_space,))
+    hidden = tf.keras.layers.Dense(32, activation='relu', 
+                   kernel_initializer=tf.keras.initializers.VarianceScaling(
+                   scale=2.0, mode='fan_in', distribution='truncated_normal'), 
+                   name='dense1')(inputs)
+    hidden = tf.keras.layers.Dense(32, activation='relu',
+                   kernel_initializer=tf.keras.initializers.VarianceScaling(
+                   scale=2.0, mode='fan_in', distribution='truncated_normal'),
+                   name='dense2')(hidden)
+    value = tf.keras.layers.Dense(1, name='value')(hidden)
+    advantage = tf.keras.layers.Dense(action_space, name='advantage')(hidden)
+    # Inside a layer, TF ops on symbolic Keras tensors fail under Keras 3
+    q_values = tf.keras.layers.Lambda(
+                   lambda heads: heads[0] + (heads[1] - tf.reduce_mean(heads[1], axis=1, keepdims=True)),
+                   name='q_values')([value, advantage])
+    
+    model = tf.keras.Model(inputs=inputs, outputs=q_values)
+    model.compile(loss='mse', optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate))
+    
+    return model
+
+class DQN:
+    """
+    DQN agent class, responsible for building network
+    double_dqn picks the next action with the online network and evaluates it with the target network,
+    dueling uses the value/advantage network
+    Throughput mode: gradient_steps updates per replay call on minibatches split from one sampled block,
+    lr_scaling 'linear' or 'sqrt' scales learning_rate by batch_size / reference_batch_size (or its root),
+    epsilon_scaling decays epsilon per sampled transition instead of per replay call, relative to reference_batch_size
+    n_step > 1 stores n-step returns built by an NStepBuffer, the targets bootstrap with gamma^n_step
+    """
+    def __init__(self, 
+                 agent_name,
+                 state_space,
+                 action_space,
+                 epsilon_decay,
+                 discount_rate,
+                 learning_rate,
+                 min_step_to_learn,
+                 replay_memory,
+                 batch_size,
+                 target_update_interval,
+                 training_interval,
+                 n_envs=1,
+                 prioritized_replay=False,
+                 replay_directory=None,
+                 double_dqn=False,
+                 dueling=False,
+                 gradient_steps=1,
+                 lr_scaling=None,
+                 epsilon_scaling=False,
+                 reference_batch_size=32,
+                 n_step=1):
+
+        self.agent_name = agent_name
+        self.double_dqn = double_dqn
+        self.dueling = dueling
+
+        self.state_space = state_space
+        self.action_space = action_space
+
+        # Default parameters
+        self.epsilon = 1
+        self.epsilon_min = .01
+
+        # Hyperparameters
+        self.epsilon_decay = epsilon_decay
+        self.gamma = discount_rate
+        self.n_step = n_step
+        self.update_target_model_freq = target_update_interval
+        self.learning_rate = learning_rate
+        self.gradient_steps = gradient_steps
+        batch_ratio = batch_size / reference_batch_size
+        if lr_scaling == 'linear':
+            self.learning_rate = learning_rate * batch_ratio
+        elif lr_scaling == 'sqrt':
+            self.learning_rate = learning_rate * np.sqrt(batch_ratio)
+        elif lr_scaling is not None:
+            raise ValueError(f"lr_scaling must be None, 'linear' or 'sqrt', got {lr_scaling}")
+        # Decay per replay call, the same epsilon after as many sampled transitions as the reference batch
+        self.epsilon_decay_per_replay = epsilon_decay ** (batch_ratio * gradient_steps) if epsilon_scaling else epsilon_decay
+        self.min_step_to_learn = min_step_to_learn
+        # For experience replay
+        # With a replay_directory the replay lives in np.memmap files there instead of RAM
+        if prioritized_replay:
+            storage = None
+            if replay_directory is not None:
+                storage = open_replay_columns(replay_directory, replay_memory - replay_memory % n_envs, state_space)
+            self.memory = PrioritizedReplayMemory(replay_memory, state_space, stride=n_envs, storage=storage, n_step=n_step)
+        elif replay_directory is not None:
+            # Minibatches are read ahead, skip the slots written before the next replay call
+            self.memory = MemmapReplayMemory(replay_memory, state_space, replay_directory, stride=n_envs,
+                                             guard=training_interval * n_envs, n_step=n_step)
+        else:
+            self.memory = ReplayMemory(replay_memory, state_space, stride=n_envs, n_step=n_step) # Preallocated ring buffer, one block per env step
+        # Rolling window of the last n_step steps per env, turns steps into n-step transitions before the replay
+        self.n_step_buffer = NStepBuffer(n_step, discount_rate, state_space, n_envs) if n_step > 1 else None
+        self.batch_size = batch_size
+        self.training_interval = training_interval
+
+        # Create models
+        self.model = self.build_model() # Create training model
+        self.target_model = self.build_model() # Create target model
+        self.target_model.set_weights(self.model.get_weights()) # Initialize target mode
+        self.train_step = self.compile_train_step() # Single graph update from a sampled batch
+        
+        # Statistics
+        self.step = 0
+        self.episode_scores = []
+        self.episode_lengths = []
+        self.scores = []
+        self.scores_ma100 = [] # Mean score of the last 100 episodes, after each episode
+        self.scores_ma100_up = [] # Plus one std
+        self.scores_ma100_lo = [] # Minus one std
+        self.episode_log = None # EpisodeLog the metrics of each episode are appended to
+        self.episodes_agg = 0
+        self.timesteps_agg = 0
+        self.time_start = time.process_time()
+        self.profiler = Profiler() # Wall time per training phase
+
+
+    def build_model(self):
+        return build_q_network(self.state_space, self.action_space, self.learning_rate, self.dueling)
+
+    def act(self, state):
+        if np.random.rand() > self.epsilon: # Epsilon greedy policy
+            return self.act_greedy(state) # Exploit, action return 0...7
+        else:
+            return self.act_random() # Explore by choosing random action, 0...7
+
+    def act_greedy(self, state): # For rollout, no random noise
+        return greedy_actions(self.model, state)[0] # action return code 0...7
+
+    def act_greedy_batch(self, states):
+        return greedy_actions(self.model, states)
+
+    def act_random(self, rng=random):
+        return rng.sample(range(8), 1)[0] #2**env.action_space.shape[0])
+
+    def act_batch(self, states):
+        """Epsilon greedy actions for a batch of states, one forward pass for all envs"""
+        actions = self.act_greedy_batch(states)
+        explore = np.random.rand(len(actions)) <= self.epsilon
+        actions[explore] = np.random.randint(0, self.action_space, size=np.count_nonzero(explore))
+        return actions
+    
+    def update_replay_memory(self, state, action, reward, next_state, done):
+        if self.n_step_buffer is None:
+            self.memory.add(state, action, reward, next_state, done)
+            return
+        for transition in self.n_step_buffer.push(state, action, reward, next_state, done):
+            self.memory.add(*transition)
+
+    def update_replay_memory_batch(self, states, actions, rewards, next_states, dones):
+        if self.n_step_buffer is None:
+            self.memory.add_batch(states, actions, rewards, next_states, dones)
+            return
+        transitions = self.n_step_buffer.push_batch(states, actions, rewards, next_states, dones)
+        if transitions is not None:
+            self.memory.add_batch(*transitions)
+
+    def replay(self):
+        # Start training only if sufficient number of samples is already saved
+        if len(self.memory) < self.min_step_to_learn:
+            return
+
+        # Sample minibatches of s a r s' from the experience, one block for all gradient steps
+        with self.profiler.phase('sample'):
+            idx = self.memory.sample_indices(self.batch_size * self.gradient_steps)
+            states, actions, rewards, next_states, dones = self.memory.get(idx)
+            weights = self.memory.importance_weights(idx)
+
+        # Compute targets and update weights, one update per minibatch of the block
+        with self.profiler.phase('train'):
+            loss, td_errors = self.train_step(states, actions.astype(np.int32), rewards, next_states, dones.astype(np.float32), weights)
+            self.memory.update_priorities(idx, td_errors.numpy()) # Also waits for the update to finish
+        self.profiler.updates += self.gradient_steps
+        
+        # Decay epsilon, less exploration, more exploitation
+        if self.epsilon > self.epsilon_min:
+            self.epsilon *= self.epsilon_decay_per_replay
+            self.epsilon = max(self.epsilon_min, self.epsilon)
+
+    def compile_train_step(self):
+        """
+        Trace target computation, Q(s,a) gather, loss and optimizer update into one graph
+        Returns loss and TD errors of the batch, the TD errors are the new replay priorities
+        Double DQN runs the online network on states and next states as one concatenated batch
+        With gradient_steps K the batch is split in K minibatches, updated one after the other in the same graph
+        """
+        model = self.model
+        target_model = self.target_model
+        optimizer = model.optimizer
+        gamma = self.gamma ** self.n_step # Replay holds n-step returns, bootstrapped n steps later
+        action_space = self.action_space
+        double_dqn = self.double_dqn
+        gradient_steps = self.gradient_steps
+        
+        @tf.function(input_signature=[tf.TensorSpec(shape=(None, self.state_space), dtype=tf.float32),
+                                      tf.TensorSpec(shape=(None,), dtype=tf.int32),
+                                      tf.TensorSpec(shape=(None,), dtype=tf.float32),
+                                      tf.TensorSpec(shape=(None, self.state_space), dtype=tf.float32),
+                                      tf.TensorSpec(shape=(None,), dtype=tf.float32),
+                                      tf.TensorSpec(shape=(None,), dtype=tf.float32)])
+        def train_step(states, actions, rewards, next_states, dones, weights):
+            if gradient_steps == 1:
+                return update(states, actions, rewards, next_states, dones, weights)
+            
+            # Unrolled when traced, later minibatches see the weights updated by the earlier ones
+            batch_size = tf.shape(states)[0] // gradient_steps
+            losses, td_errors = [], []
+            for k in range(gradient_steps):
+                batch = slice(k * batch_size, (k + 1) * batch_size)
+                loss, errors = update(states[batch], actions[batch], rewards[batch], next_states[batch], dones[batch], weights[batch])
+                losses.append(loss)
+                td_errors.append(errors)
+            return tf.reduce_mean(losses), tf.concat(td_errors, axis=0)
+        
+        def update(states, actions, rewards, next_states, dones, weights):
+            with tf.GradientTape() as tape:
+                if double_dqn:
+                    n = tf.shape(states)[0]
+                    q_both = model(tf.concat([states, next_states], axis=0), training=True)
+                    q_values = q_both[:n]
+                    # Online network picks the next action, target network evaluates it
+                    next_actions = tf.argmax(tf.stop_gradient(q_both[n:]), axis=1, output_type=tf.int32)
+                    future_q = tf.gather(target_model(next_states, training=False), next_actions, axis=1, batch_dims=1)
+                else:
+                    q_values = model(states, training=True)
+                    # Use target network for max_future_q
+                    future_q = tf.reduce_max(target_model(next_states, training=False), axis=1)
+                targets = tf.stop_gradient(rewards + gamma * future_q * (1 - dones)) # if done=1, future_q=0 => targets = reward
+                
+                q_taken = tf.gather(q_values, actions, axis=1, batch_dims=1)
+                td_errors = targets - q_taken
+                # Same as mse over the full target row, where only the taken action differs from the prediction
+                # weights are the importance sampling correction of prioritized replay, ones otherwise
+                loss = tf.reduce_mean(weights * tf.square(td_errors)) / action_space
+            
+            gradients = tape.gradient(loss, model.trainable_variables)
+            optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+            return loss, td_errors
+        
+        return train_step
+
+    def update_target_model(self):
+        with self.profiler.phase('target_sync'):
+            self.target_model.set_weights(self.model.get_weights())
+
+#    def plot_learning_curve2(self): # For slimevolley
+#        # Plot total score vs episode
+#        ep = len(self.scores)
+#        fig, ax = plt.subplots()
+#        ax.plot(self.scores,
+#                color='blue', alpha=0.4, linewidth=0.5, 
+#                label='Total score in each episode')
+#        ax.hlines(0, xmin=0, xmax=ep, colors='red')
+#        ax.set(xlabel='Episode', ylabel='Total score', ylim=[-5, 5], title='DQN with experience replay')
+#        plt.legend(bbox_to_anchor=(1.04, 0), loc="lower left", borderaxespad=0)
+#        plt.show()
+#        return
+    
+    #def learn(self, total_timesteps, abort_training, tensorboard_log_name, log_interval):
+        # training is limited by timesteps instead of episodes
+        #return trained_model
+
+    #def save(self):
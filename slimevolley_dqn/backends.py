@@ -0,0 +1,83 @@
+"""
+Heavy backends and process setup
+TensorFlow, gym and slimevolleygym take seconds to import, so they stand behind LazyModule proxies
+and are only imported by the first attribute access, e.g. a worker that runs NumPy policies never imports TF
+Seeding and the Colab drive mount run when called, not on import
+"""
+
+import importlib
+import multiprocessing
+import random
+import sys
+
+import numpy as np
+
+class LazyModule:
+    """Stands in for a module, which is imported on the first attribute access"""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+tf = LazyModule('tensorflow')
+gym = LazyModule('gym')
+spaces = LazyModule('gym.spaces')
+seeding = LazyModule('gym.utils.seeding')
+slimevolleygym = LazyModule('slimevolleygym')
+
+def make_env(env_id='SlimeVolley-v0'):
+    """gym.make, after importing slimevolleygym, which registers SlimeVolley-v0 with gym"""
+    slimevolleygym._load()
+    return gym.make(env_id)
+
+# Modules of this package that import slimevolleygym at the top, as they subclass or copy from it
+selfplay = LazyModule(__package__ + '.selfplay')
+simulator = LazyModule(__package__ + '.simulator')
+
+# Set seed for experiment reproducibility
+# Does not work with GPU runtime
+seed = 721
+
+def set_seeds(seed):
+    """Seed NumPy, core Python and the TensorFlow backend, imports TF"""
+    # For starting Numpy generated random numbers
+    # in a well-defined initial state.
+    np.random.seed(seed)
+    # For starting core Python generated random numbers
+    # in a well-defined state.
+    random.seed(seed)
+    # The below set_seed() will make random number generation
+    # in the TensorFlow backend have a well-defined initial state.
+    tf.random.set_seed(seed)
+
+def spawn_context():
+    """multiprocessing context for actor, evaluation and experiment workers, TF is not fork safe"""
+    return multiprocessing.get_context('spawn')
+
+"""# Colab specific chunk"""
+
+def in_colab():
+    return 'google.colab' in sys.modules
+
+def mount_drive(mountpoint='/content/drive'):
+    """
+    Google drive file IO
+    If run in colab, mounting will be required for file IO with google drive, asks to authorize
+    """
+    if in_colab():
+        from google.colab import drive
+        drive.mount(mountpoint)
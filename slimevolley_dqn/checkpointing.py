@@ -0,0 +1,262 @@
+"""# Checkpointing"""
+
+import json
+import os
+import random
+
+# For checkpointing in the background
+import pickle
+import queue
+import shutil
+import threading
+
+import numpy as np
+
+from .backends import tf
+from .metrics import rolling_stats
+from .replay import ReplayMemory
+
+class Checkpointer:
+    """
+    Saves the full training state of an agent from a background thread, the learner only waits for the copy
+    logdir/<agent_name>_checkpoint/ holds
+      step<N>/ network, target network and optimizer weights, epsilon, counters, episode history and RNG states
+      replay/ one .npy file per replay column (np.load with mmap_mode works), updated in place
+              with only the slots written since the previous checkpoint, matches the newest step<N>;
+              when the whole of a memmap replay is written, the writer thread copies its files instead of reading it into RAM
+    Only the newest keep step<N> directories are kept
+    Shared actor/learner replay is not saved, the actors refill it after resuming
+    """
+    def __init__(self, logdir, agent_name, interval=10000, keep=3):
+        self.directory = os.path.join(logdir, agent_name + '_checkpoint')
+        self.interval = interval # Env steps
+        self.keep = keep
+        self.last_step = 0
+        self.replay_mark = None # memory.n_added at the previous checkpoint, None writes the whole replay
+        self.error = None # Raised in the training thread on the next save
+        self.jobs = queue.Queue(maxsize=2) # The learner blocks only if the writer falls two checkpoints behind
+        self.writer = threading.Thread(target=self._write_jobs, daemon=True)
+        self.writer.start()
+
+    def step_dir(self, step):
+        return os.path.join(self.directory, 'step' + str(step))
+
+    def steps(self):
+        """Steps of the complete checkpoints on disk, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name for name in os.listdir(self.directory) if name.startswith('step') and name[4:].isdigit()]
+        return sorted(int(name[4:]) for name in names)
+
+    def maybe_save(self, agent):
+        """Save when agent.step passed a multiple of interval since the last checkpoint"""
+        if agent.step // self.interval > self.last_step // self.interval:
+            self.save(agent)
+
+    def save(self, agent):
+        """Copy the training state of agent and queue writing it"""
+        self.last_step = agent.step
+        state = {'step': agent.step,
+                 'epsilon': agent.epsilon,
+                 'episode_scores': list(agent.episode_scores),
+                 'episode_lengths': list(agent.episode_lengths),
+                 'scores': list(agent.scores),
+                 'updates': agent.profiler.updates,
+                 'random': random.getstate(),
+                 'np_random': np.random.get_state()}
+        weights = {'model': agent.model.get_weights(),
+                   'target_model': agent.target_model.get_weights(),
+                   'optimizer': [v.numpy() for v in agent.model.optimizer.variables]}
+        replay = self._copy_replay(agent.memory) if isinstance(agent.memory, ReplayMemory) else None
+        self._submit(lambda: self._write(agent.step, state, weights, replay))
+
+    def save_model(self, model, filepath):
+        """Queue model.save to a .keras filepath, model must not be trained further, e.g. a frozen opponent snapshot"""
+        self._submit(lambda: model.save(filepath))
+
+    def restore(self, agent):
+        """Load the newest checkpoint into agent, return its step or None if there is none"""
+        steps = self.steps()
+        if not steps:
+            return None
+        step = steps[-1]
+        directory = self.step_dir(step)
+        
+        weights = {'model': [], 'target_model': [], 'optimizer': []}
+        with np.load(os.path.join(directory, 'weights.npz')) as data:
+            for key in sorted(data.files, key=lambda key: int(key.rsplit('_', 1)[1])):
+                weights[key.rsplit('_', 1)[0]].append(data[key])
+        agent.model.set_weights(weights['model'])
+        agent.target_model.set_weights(weights['target_model'])
+        optimizer = agent.model.optimizer
+        if len(optimizer.variables) < len(weights['optimizer']):
+            # Optimizer slots are created by the first update, a zero gradient Adam update leaves the weights as they are
+            variables = agent.model.trainable_variables
+            optimizer.apply_gradients(zip([tf.zeros_like(v) for v in variables], variables))
+        for variable, value in zip(optimizer.variables, weights['optimizer']):
+            variable.assign(value)
+        
+        with open(os.path.join(directory, 'state.pkl'), 'rb') as f:
+            state = pickle.load(f)
+        agent.step = state['step']
+        agent.epsilon = state['epsilon']
+        agent.episode_scores = state['episode_scores']
+        agent.episode_lengths = state['episode_lengths']
+        agent.scores = state['scores']
+        mean, std = rolling_stats(agent.episode_scores, 100)
+        agent.scores_ma100, agent.scores_ma100_up, agent.scores_ma100_lo = list(mean), list(mean + std), list(mean - std)
+        agent.profiler.updates = state['updates']
+        random.setstate(state['random'])
+        np.random.set_state(state['np_random'])
+        
+        if isinstance(agent.memory, ReplayMemory):
+            self._restore_replay(agent.memory, step)
+        self.last_step = step
+        return step
+
+    def wait(self):
+        """Block until all queued checkpoints are written"""
+        self.jobs.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        if self.writer.is_alive():
+            self.jobs.put(None)
+            self.writer.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _submit(self, job):
+        if self.error is not None:
+            raise self.error
+        self.jobs.put(job)
+
+    def _write_jobs(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                if self.error is None: # Stop writing after a failure, later checkpoints may depend on it
+                    job()
+            except Exception as e:
+                self.error = e
+            finally:
+                self.jobs.task_done()
+
+    def _copy_replay(self, memory):
+        if self.replay_mark is None:
+            slices = [slice(0, memory.capacity)]
+        else:
+            slices = memory.written_since(self.replay_mark)
+        self.replay_mark = memory.n_added
+        columns = memory.columns()
+        files = None
+        if slices == [slice(0, memory.capacity)] and all(isinstance(column, np.memmap) for column in columns.values()):
+            files = memory # Its files are copied by the writer thread, the columns are never read into RAM
+            columns = {}
+        counters, arrays = memory.checkpoint_state()
+        return {'capacity': memory.capacity,
+                'stride': memory.stride,
+                'n_step': memory.n_step,
+                'columns': {name: [(s.start, column[s].copy()) for s in slices] for name, column in columns.items()},
+                'files': files,
+                'counters': counters,
+                'arrays': {name: array.copy() for name, array in arrays.items()}}
+
+    def _copy_replay_files(self, replay):
+        """
+        Snapshot a memmap replay by copying its files on the writer thread, the buffer may be larger than RAM
+        The learner keeps adding meanwhile, the oldest slots it may have overwritten before the copy finished
+        are left out of the checkpoint, the next one writes them again
+        """
+        memory = replay['files']
+        directory = os.path.join(self.directory, 'replay')
+        os.makedirs(directory, exist_ok=True)
+        meta = os.path.join(directory, 'replay.json')
+        if os.path.exists(meta):
+            os.remove(meta) # The files stop matching the step it names
+        for name, column in memory.columns().items():
+            column.flush()
+            shutil.copyfile(column.filename, os.path.join(directory, name + '.tmp.npy'))
+            os.replace(os.path.join(directory, name + '.tmp.npy'), os.path.join(directory, name + '.npy'))
+        
+        # Slots from ptr on, the transitions added during the copy, one more block that may be under way, and their next states
+        counters = replay['counters']
+        overwritten = min(memory.n_added - counters['n_added'] + memory.stride + memory.lookahead, replay['capacity'])
+        counters['size'] = max(0, min(counters['size'], replay['capacity'] - overwritten))
+        if 'priorities' in replay['arrays']:
+            replay['arrays']['priorities'][(counters['ptr'] + np.arange(overwritten)) % replay['capacity']] = 0
+
+    def _write(self, step, state, weights, replay):
+        os.makedirs(self.directory, exist_ok=True)
+        directory = self.step_dir(step)
+        tmp = directory + '.tmp' # Renamed when complete, an interrupted write is never restored
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        np.savez(os.path.join(tmp, 'weights.npz'), 
+                 **{name + '_' + str(i): w for name, values in weights.items() for i, w in enumerate(values)})
+        with open(os.path.join(tmp, 'state.pkl'), 'wb') as f:
+            pickle.dump(state, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp, directory)
+        
+        if replay is not None:
+            self._write_replay(step, replay)
+        
+        for old in self.steps()[:-self.keep]:
+            shutil.rmtree(self.step_dir(old), ignore_errors=True)
+
+    def _write_replay(self, step, replay):
+        if replay['files'] is not None:
+            self._copy_replay_files(replay)
+        directory = os.path.join(self.directory, 'replay')
+        os.makedirs(directory, exist_ok=True)
+        for name, blocks in replay['columns'].items():
+            filepath = os.path.join(directory, name + '.npy')
+            shape = (replay['capacity'],) + blocks[0][1].shape[1:]
+            dtype = blocks[0][1].dtype
+            column = None
+            if os.path.exists(filepath):
+                column = np.load(filepath, mmap_mode='r+')
+                if column.shape != shape or column.dtype != dtype:
+                    column = None
+            if column is None:
+                column = np.lib.format.open_memmap(filepath, mode='w+', dtype=dtype, shape=shape)
+            for start, values in blocks:
+                column[start:start + len(values)] = values
+            column.flush()
+            del column
+        for name, array in replay['arrays'].items():
+            np.save(os.path.join(directory, name + '.tmp.npy'), array)
+            os.replace(os.path.join(directory, name + '.tmp.npy'), os.path.join(directory, name + '.npy'))
+        
+        # Written last, the replay files only count as the checkpoint at step once this names it
+        meta = {'step': step, 'capacity': replay['capacity'], 'stride': replay['stride'], 'n_step': replay['n_step'],
+                'counters': replay['counters'], 'arrays': sorted(replay['arrays'])}
+        with open(os.path.join(directory, 'replay.json.tmp'), 'w') as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(directory, 'replay.json.tmp'), os.path.join(directory, 'replay.json'))
+
+    def _restore_replay(self, memory, step):
+        directory = os.path.join(self.directory, 'replay')
+        try:
+            with open(os.path.join(directory, 'replay.json')) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return
+        if (meta['step'], meta['capacity'], meta['stride'], meta.get('n_step', 1)) != (step, memory.capacity, memory.stride, memory.n_step):
+            print(f'CHECKPOINT: replay files do not match step {step}, starting with an empty replay')
+            return
+        for name, column in memory.columns().items():
+            column[:] = np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+        arrays = {name: np.load(os.path.join(directory, name + '.npy')) for name in meta['arrays']}
+        memory.load_checkpoint_state(meta['counters'], arrays)
+        self.replay_mark = memory.n_added
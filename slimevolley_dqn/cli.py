@@ -0,0 +1,63 @@
+"""
+Command line entry point
+
+    python -m slimevolley_dqn train --selfplay --runs 5 --max-steps 50000 --logdir dqn_test/
+    python -m slimevolley_dqn train --selfplay --resume
+    python -m slimevolley_dqn train --n-envs 8 --double-dqn --dueling --n-step 3 --eval-workers 2
+    python -m slimevolley_dqn sweep
+"""
+
+import argparse
+import os
+
+from .backends import mount_drive
+from .experiments import run_sweep
+from .training import TRAINING_DEFAULTS, run_training
+
+# Values of the run_training options that take a string
+OPTION_CHOICES = {
+    'lr_scaling': ['linear', 'sqrt'],
+    'profile_format': ['jsonl', 'csv'],
+    'export_dtype': ['float32', 'float16', 'int8'],
+    'eval_export_dtype': ['float32', 'float16', 'int8'],
+}
+
+def add_training_options(parser):
+    """
+    One flag per entry of TRAINING_DEFAULTS, e.g. --n-envs 8, --dueling/--no-dueling
+    Flags that are not given are left out of the parsed args, so run_training keeps its defaults
+    """
+    group = parser.add_argument_group('run_training options', 'Override TRAINING_DEFAULTS, see training.py')
+    for name, default in TRAINING_DEFAULTS.items():
+        flag = '--' + name.replace('_', '-')
+        help = f'default {default!r}'
+        if isinstance(default, bool):
+            group.add_argument(flag, action=argparse.BooleanOptionalAction, default=argparse.SUPPRESS, help=help)
+        elif default is None or isinstance(default, str):
+            group.add_argument(flag, choices=OPTION_CHOICES.get(name), default=argparse.SUPPRESS, help=help)
+        else:
+            group.add_argument(flag, type=type(default), default=argparse.SUPPRESS, help=help)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='slimevolley_dqn', description='DQN with self play on SlimeVolley')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    train_parser = subparsers.add_parser('train', help='Train agents with run_training')
+    train_parser.add_argument('--selfplay', action='store_true', help='Train against past best models instead of the baseline policy')
+    train_parser.add_argument('--runs', type=int, default=5, help='Agents trained one after another, each with its own seed')
+    train_parser.add_argument('--max-steps', type=int, default=50000, help='Training steps of each agent')
+    train_parser.add_argument('--logdir', default='dqn_test/', help='Directory for models, checkpoints and episode logs')
+    train_parser.add_argument('--resume', action='store_true', help='Continue each agent from its newest checkpoint in logdir')
+    add_training_options(train_parser)
+    
+    subparsers.add_parser('sweep', help='Train the variants of run_sweep over several seeds in parallel processes')
+    args = parser.parse_args(argv)
+    
+    mount_drive() # Only in colab
+    if args.command == 'train':
+        options = {name: getattr(args, name) for name in TRAINING_DEFAULTS if hasattr(args, name)}
+        run_training(selfplay_mode=args.selfplay, N=args.runs, max_steps=args.max_steps,
+                     logdir=os.path.join(args.logdir, ''), resume=args.resume, **options) # Filenames are appended to logdir
+    elif args.command == 'sweep':
+        run_sweep()
+    return 0
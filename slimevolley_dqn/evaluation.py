@@ -0,0 +1,282 @@
+"""# Evaluation"""
+
+import random
+
+import numpy as np
+
+from .agent import DQN, build_q_network
+from .backends import make_env, selfplay, spawn_context
+from .inference import NumpyPolicy
+from .utils import action_inverse
+from .wrappers import wrap_env
+
+"""## Rollout for 1 episode"""
+
+def rollout_random(env, agent, render_mode=False, rng=random):
+    """
+    For testing one agent vs random, for one episode
+    rng drives the random opponent, pass a seeded random.Random for reproducible rollouts
+    """
+    # Initialize
+    state = env.reset()
+
+    done = False
+    total_reward = 0
+    
+    while not done:
+
+        if render_mode:
+            env.render()
+        
+        state = np.reshape(state, (1, -1))
+       
+        state, reward, done, _ = env.step(action_inverse(agent.act_greedy(state)), action_inverse(agent.act_random(rng)))
+
+        total_reward += reward
+
+    return total_reward
+
+def rollout_agents(env, agent0, agent1, render_mode=False):
+    """
+    For testing one agent vs other, for one episode
+    Agent is incompatible with BaselinePolicy() at the moment, due to input shape problem, use separate function
+    """
+    # Initialize
+    state = env.reset()
+    _state = state
+    
+    done = False
+    total_reward = 0
+    
+    while not done:
+
+        if render_mode:
+            env.render()
+        
+        state = np.reshape(state, (1, -1))
+        _state = np.reshape(_state, (1, -1))
+        action0 = action_inverse(agent0.act_greedy(state))
+        action1 = action_inverse(agent1.act_greedy(_state))
+        
+        state, reward, done, info = env.step(action0, action1)
+        
+        state = np.reshape(state, (1, -1))
+        _state = info['otherObs'] # Provide observation in policy1 perspective
+        _state = np.reshape(_state, (1, -1))
+        
+        total_reward += reward
+
+    return total_reward
+
+def rollout_baseline(env, agent, render_mode=False):
+    """For testing one agent vs baseline, for one episode"""
+    # Initialize
+    state = env.reset()
+
+    done = False
+    total_reward = 0
+    
+    while not done:
+
+        if render_mode:
+            env.render()
+        
+        state = np.reshape(state, (1, -1))
+       
+        state, reward, done, _ = env.step(action_inverse(agent.act_greedy(state)))
+
+        total_reward += reward
+
+    return total_reward
+
+def rollout_bestmodel(env, agent, render_mode=False, rng=random):
+    """For testing one agent vs best model under self play env, for one episode"""
+    # Initialize
+    state = env.reset()
+    _state = state
+    
+    done = False
+    total_reward = 0
+    
+    while not done:
+
+        if render_mode:
+            env.render()
+        
+        state = np.reshape(state, (1, -1))
+        _state = np.reshape(_state, (1, -1))
+       
+        state, reward, done, info = env.step(action_inverse(agent.act_greedy(state)), action_inverse(env.predict(_state, rng)))
+
+        state = np.reshape(state, (1, -1))
+        _state = info['otherObs'] # Provide observation in policy1 perspective
+        _state = np.reshape(_state, (1, -1))
+        
+        total_reward += reward
+
+    return total_reward
+
+"""## Evaluate agent"""
+
+def print_evaluation(label, history):
+    n_trials = len(history)
+    print(f'EVAL {label}-Mean total score: {np.round(np.mean(history), 3)} ± {np.round(np.std(history), 3)} over {n_trials} trials, {history}')
+
+def evaluate_interim(env, agent, n_trials=5, init_seed=123, render_mode=False, pool=None):
+    """
+    Wrapper for repetitive rollouts using different seeds, playing against random policy
+    Rollouts run on the EvalPool workers if pool is given, with identical results
+    """
+    if pool is not None:
+        history = pool.run('random', agent.model, n_trials=n_trials, init_seed=init_seed)
+    else:
+        history = []
+        for i in range(n_trials):
+            env.seed(seed=init_seed + i)
+            episode_score = rollout_random(env, agent, render_mode, rng=random.Random(init_seed + i))
+            history.append(episode_score)
+    print_evaluation('INTERIM', history)
+    return history
+
+def evaluate_agents(env, agent0, agent1, n_trials=5, init_seed=123, render_mode=False, pool=None):
+    """
+    Wrapper for repetitive rollouts using different seeds, playing between two user agents
+    """
+    if pool is not None:
+        history = pool.run('agents', agent0.model, agent1.model, n_trials=n_trials, init_seed=init_seed)
+    else:
+        history = []
+        for i in range(n_trials):
+            env.seed(seed=init_seed + i)
+            episode_score = rollout_agents(env, agent0, agent1, render_mode)
+            history.append(episode_score)
+    print_evaluation('AGENTS', history)
+    return history
+
+def evaluate_bestmodel(env, agent, n_trials=5, init_seed=123, render_mode=False, pool=None):
+    """
+    Wrapper for repetitive rollouts using different seeds, playing against best model in selfplay
+    """
+    if pool is not None:
+        history = pool.run('bestmodel', agent.model, env.best_model, n_trials=n_trials, init_seed=init_seed)
+    else:
+        history = []
+        for i in range(n_trials):
+            env.seed(seed=init_seed + i)
+            episode_score = rollout_bestmodel(env, agent, render_mode, rng=random.Random(init_seed + i))
+            history.append(episode_score)
+    print_evaluation('BESTMODEL', history)
+    return history
+
+"""## Parallel evaluation"""
+
+class PolicySnapshot:
+    """
+    Greedy policy on a copy of network weights, lives in an evaluation worker
+    """
+    act_greedy = DQN.act_greedy
+    act_greedy_batch = DQN.act_greedy_batch
+    act_random = DQN.act_random
+
+    def __init__(self, state_space, action_space, dueling=False):
+        self.model = build_q_network(state_space, action_space, learning_rate=0.001, dueling=dueling)
+        self.weights_key = None
+
+    def load(self, key, weights):
+        if key != self.weights_key: # Tasks of one evaluation share the weights
+            self.model.set_weights(weights)
+            self.weights_key = key
+
+_eval_worker = {} # Per process env and policies, filled by _eval_worker_init
+
+def _eval_worker_init(selfplay_mode, state_space, action_space, dueling, frame_skip=1, n_stack=1):
+    _eval_worker['env'] = wrap_env(selfplay.SlimeVolleySelfPlayEnv() if selfplay_mode else make_env(), frame_skip, n_stack)
+    _eval_worker['network'] = (state_space, action_space, dueling)
+
+def _eval_worker_policy(role, key, weights):
+    """
+    NumpyPolicy for the arrays of an exported policy, else the PolicySnapshot of role loaded with the weights
+    The snapshots are built on first use, a worker that only receives NumpyPolicy arrays never imports TF
+    """
+    if isinstance(weights, dict):
+        return NumpyPolicy(weights)
+    if role not in _eval_worker:
+        _eval_worker[role] = PolicySnapshot(*_eval_worker['network'])
+    _eval_worker[role].load(key, weights)
+    return _eval_worker[role]
+
+def _eval_worker_rollout(task):
+    """One seeded rollout, same seeding as the serial evaluate_* loops"""
+    kind, key, weights, opponent_weights, trial_seed = task
+    env = _eval_worker['env']
+    agent = _eval_worker_policy('agent', key, weights)
+    opponent = _eval_worker_policy('opponent', key, opponent_weights) if opponent_weights is not None else None
+    
+    env.seed(seed=trial_seed)
+    rng = random.Random(trial_seed)
+    if kind == 'random':
+        return rollout_random(env, agent, rng=rng)
+    elif kind == 'agents':
+        return rollout_agents(env, agent, opponent)
+    elif kind == 'bestmodel':
+        env.best_model = opponent.model if opponent is not None else None
+        return rollout_bestmodel(env, agent, rng=rng)
+    raise ValueError(f'Unknown rollout kind {kind}')
+
+class EvalJob:
+    """Handle of an evaluation running on the EvalPool"""
+    def __init__(self, async_result, label, step):
+        self.async_result = async_result
+        self.label = label
+        self.step = step # Agent step when the weights were snapshotted
+
+    def ready(self):
+        return self.async_result.ready()
+
+    def get(self):
+        return self.async_result.get()
+
+class EvalPool:
+    """
+    Process pool for evaluation, seeded rollouts init_seed + i are fanned out to the workers
+    Each worker holds its own env and receives a snapshot of the weights with every task
+    With export_dtype the snapshots are NumpyPolicy arrays, the workers then start and run without TF
+    """
+    def __init__(self, n_workers, selfplay_mode=False, state_space=12, action_space=8, dueling=False, frame_skip=1, n_stack=1,
+                 export_dtype=None):
+        ctx = spawn_context()
+        self.pool = ctx.Pool(n_workers, initializer=_eval_worker_init, 
+                             initargs=(selfplay_mode, state_space, action_space, dueling, frame_skip, n_stack))
+        self.export_dtype = export_dtype
+        self.n_submitted = 0
+
+    def snapshot(self, model):
+        """Weights of model sent with the tasks, the arrays of a NumpyPolicy are sent as they are"""
+        if isinstance(model, NumpyPolicy):
+            return model.arrays
+        if self.export_dtype is not None:
+            return NumpyPolicy.from_weights(model.get_weights(), self.export_dtype).arrays
+        return model.get_weights()
+
+    def submit(self, kind, model, opponent_model=None, n_trials=5, init_seed=123, label=None, step=None):
+        """Start an evaluation without blocking, return an EvalJob"""
+        self.n_submitted += 1
+        weights = self.snapshot(model)
+        opponent_weights = self.snapshot(opponent_model) if opponent_model is not None else None
+        tasks = [(kind, self.n_submitted, weights, opponent_weights, init_seed + i) for i in range(n_trials)]
+        async_result = self.pool.map_async(_eval_worker_rollout, tasks, chunksize=1)
+        return EvalJob(async_result, label or kind.upper(), step)
+
+    def run(self, kind, model, opponent_model=None, n_trials=5, init_seed=123):
+        """Blocking evaluation, result in seed order"""
+        return self.submit(kind, model, opponent_model, n_trials, init_seed).get()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,146 @@
+"""# Experiment runner"""
+
+import json
+import os
+import time
+
+from .backends import seed, spawn_context, tf
+from .training import run_training
+
+def sweep(variants, seeds, grid=None):
+    """
+    Configurations for every (variant, seed, grid point) combination
+    variants maps a name to overrides of run_training options, grid maps an option to the values to try
+    """
+    grid = grid or {}
+    points = [{}]
+    for option, values in grid.items():
+        points = [dict(point, **{option: value}) for point in points for value in values]
+    configs = []
+    for variant, options in variants.items():
+        for point in points:
+            for run_seed in seeds:
+                config = dict(options, **point)
+                suffix = ''.join(f'_{option}{value}' for option, value in point.items())
+                config['name'] = f'{variant}{suffix}_seed{run_seed}'
+                config['variant'] = variant
+                config['seed'] = run_seed
+                configs.append(config)
+    return configs
+
+class ResultsStore:
+    """One JSON file per finished configuration, a configuration counts as done once its file exists"""
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def filepath(self, name):
+        return os.path.join(self.directory, name + '.json')
+
+    def done(self, name):
+        return os.path.exists(self.filepath(name))
+
+    def save(self, name, result):
+        with open(self.filepath(name) + '.tmp', 'w') as f:
+            json.dump(result, f)
+        os.replace(self.filepath(name) + '.tmp', self.filepath(name)) # Never leaves a partial result
+
+    def load(self, names=None):
+        if names is None:
+            names = sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+        results = {}
+        for name in names:
+            if self.done(name):
+                with open(self.filepath(name)) as f:
+                    results[name] = json.load(f)
+        return results
+
+def run_experiment(config, logdir):
+    """
+    Train one agent for one configuration with run_training in this process, models and checkpoints go to logdir/<name>/
+    The configuration overrides TRAINING_DEFAULTS and may set selfplay_mode and max_steps,
+    an interrupted configuration resumes from its newest checkpoint
+    """
+    name = config['name']
+    run_dir = os.path.join(logdir, name) + '/'
+    options = {key: value for key, value in config.items() if key not in ('name', 'variant')}
+    
+    wall_start, process_start = time.time(), time.process_time()
+    agent, = run_training(N=1, logdir=run_dir, resume=True, agent_name=name + '_', **options) # Named <name>_0
+    
+    return {'config': config,
+            'episode_log': agent.episode_log.directory, # Per episode columns, see load_episode_log
+            'episode_scores': [float(score) for score in agent.episode_scores],
+            'episode_lengths': [int(length) for length in agent.episode_lengths],
+            'steps': int(agent.step),
+            'wall_time': time.time() - wall_start, # Of this attempt, a resumed run only counts the rest
+            'process_time': time.process_time() - process_start,
+            'profile': agent.profiler.metrics(agent.step)}
+
+def pin_threads(cores, threads):
+    """Restrict this process to cores and TensorFlow to threads intra-op threads, before TF runs any op"""
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def _experiment_main(config, directory, cores, threads):
+    """Worker process: train one configuration and store its result"""
+    pin_threads(cores, threads)
+    result = run_experiment(config, os.path.join(directory, 'runs'))
+    ResultsStore(os.path.join(directory, 'results')).save(config['name'], result)
+
+def run_experiments(configs, directory="experiments/", n_workers=None, threads_per_worker=1):
+    """
+    Train each configuration in its own process, at most n_workers at a time
+    Each worker is pinned to its own threads_per_worker cores when there are enough cores,
+    finished configurations in directory are skipped, interrupted ones resume from their checkpoints
+    Returns the results of all configurations that finished, by name
+    """
+    names = [config['name'] for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError('Configuration names must be unique')
+    store = ResultsStore(os.path.join(directory, 'results'))
+    todo = [config for config in configs if not store.done(config['name'])]
+    print(f'EXPERIMENTS: {len(configs) - len(todo)} of {len(configs)} configurations already finished')
+    
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    if n_workers is None:
+        n_workers = max(1, len(cores) // threads_per_worker)
+    # Disjoint core sets per worker slot, no pinning if the cores do not go round
+    pinned = n_workers * threads_per_worker <= len(cores)
+    slots = [cores[i * threads_per_worker:(i + 1) * threads_per_worker] if pinned else None for i in range(n_workers)]
+    
+    ctx = spawn_context()
+    running = {} # slot -> (process, config)
+    while todo or running:
+        for slot in range(n_workers):
+            if slot not in running and todo:
+                config = todo.pop(0)
+                process = ctx.Process(target=_experiment_main, args=(config, directory, slots[slot], threads_per_worker))
+                process.start()
+                running[slot] = (process, config)
+                print(f"EXPERIMENTS: started {config['name']} on cores {slots[slot]}")
+        for slot, (process, config) in list(running.items()):
+            process.join(timeout=0.1)
+            if not process.is_alive():
+                del running[slot]
+                if process.exitcode == 0:
+                    print(f"EXPERIMENTS: finished {config['name']}")
+                else:
+                    print(f"EXPERIMENTS: {config['name']} failed with exit code {process.exitcode}, rerun to resume it")
+    
+    return store.load(names)
+
+def run_sweep():
+    """
+    Train the DQN variants over several seeds in parallel, replaces running one notebook per variant
+    Parameters to be changed here.
+    """
+    variants = {'NDQN': {},
+                'DDQN': {'double_dqn': True},
+                'DuelingDDQN': {'double_dqn': True, 'dueling': True}}
+    seeds = [seed + i for i in range(5)]
+    grid = {} # e.g. {'learning_rate': [0.0001, 0.001]}
+    configs = sweep(variants, seeds, grid)
+    return run_experiments(configs, directory="experiments/", threads_per_worker=1)
@@ -0,0 +1,43 @@
+"""# Policy export"""
+
+import numpy as np
+
+from .inference import NumpyPolicy, greedy_actions
+from .utils import action_inverse
+
+def policy_agreement(model, policy, states):
+    """Fraction of states where the exported policy picks the greedy action of model"""
+    return float(np.mean(greedy_actions(model, states) == policy.act_greedy_batch(states)))
+
+def export_policy(model, filepath, dtype='float16', states=None, min_agreement=None):
+    """
+    Write the greedy policy of a Q network (plain or dueling) as a NumpyPolicy .npz, load it back with load_policy
+    With states, e.g. from collect_states, the agreement of greedy actions with model is checked, stored and returned,
+    an export agreeing on less than min_agreement of the states raises ValueError and is not written
+    """
+    if min_agreement is not None and states is None:
+        raise ValueError('min_agreement needs states to check the export on')
+    policy = NumpyPolicy.from_weights(model.get_weights(), dtype)
+    agreement = None
+    if states is not None:
+        agreement = policy_agreement(model, policy, states)
+        if min_agreement is not None and agreement < min_agreement:
+            raise ValueError(f'{dtype} export of the greedy policy agrees with the model on {agreement:.1%} of {len(states)} states, '
+                             f'below {min_agreement:.1%}, {filepath} not written')
+        policy.arrays['agreement'] = np.array(agreement)
+    policy.save(filepath)
+    return policy, agreement
+
+def collect_states(env, policy, n_states=5000, init_seed=123):
+    """Observations visited by greedy rollouts of policy against the env opponent, seeded like the evaluations"""
+    states = []
+    episode = 0
+    while len(states) < n_states:
+        env.seed(init_seed + episode)
+        state = env.reset()
+        done = False
+        while not done and len(states) < n_states:
+            states.append(state)
+            state, _, done, _ = env.step(action_inverse(policy.act_greedy(state)))
+        episode += 1
+    return np.array(states, dtype=np.float32)
@@ -0,0 +1,120 @@
+"""
+# Inference
+Greedy actions of a keras Q network through a compiled tf.function, or of an exported NumpyPolicy without TF
+"""
+
+import random
+
+# For caching compiled inference functions per model
+import weakref
+
+import numpy as np
+
+from .backends import tf
+
+_greedy_fns = weakref.WeakKeyDictionary() # Compiled greedy function of each model
+
+def compile_greedy_fn(model):
+    """
+    Trace the forward pass and argmax of the model into a graph with a fixed input signature,
+    reads the live variables, so no re-tracing after weight updates
+    """
+    model_ref = weakref.ref(model) # Do not keep the model alive through the cache
+    
+    @tf.function(input_signature=[tf.TensorSpec(shape=(None, model.input_shape[-1]), dtype=tf.float32)])
+    def greedy_fn(states):
+        return tf.argmax(model_ref()(states, training=False), axis=1, output_type=tf.int32)
+    
+    return greedy_fn
+
+def greedy_actions(model, states):
+    """
+    Greedy action codes 0...7 for a batch of states, low latency replacement of model.predict
+    An exported NumpyPolicy runs its own NumPy forward pass
+    """
+    if isinstance(model, NumpyPolicy):
+        return model.act_greedy_batch(states)
+    greedy_fn = _greedy_fns.get(model)
+    if greedy_fn is None:
+        greedy_fn = _greedy_fns[model] = compile_greedy_fn(model)
+    states = np.asarray(states, dtype=np.float32).reshape(-1, model.input_shape[-1])
+    return greedy_fn(states).numpy()
+
+def fold_q_network(weights):
+    """
+    (kernel, bias) of each dense layer of a build_q_network model, from model.get_weights()
+    The dueling value and advantage heads are folded into one linear layer, V + A - mean(A) is linear in the hidden layer,
+    the softmax of the plain network is dropped as it does not change the greedy action
+    """
+    layers = [(weights[0], weights[1]), (weights[2], weights[3])]
+    if len(weights) == 8: # dense1, dense2 and the two heads, the value head has one output
+        heads = sorted([weights[4:6], weights[6:8]], key=lambda head: head[0].shape[1])
+        (value_kernel, value_bias), (advantage_kernel, advantage_bias) = heads
+        layers.append((advantage_kernel - advantage_kernel.mean(axis=1, keepdims=True) + value_kernel,
+                       advantage_bias - advantage_bias.mean() + value_bias))
+    else:
+        layers.append((weights[4], weights[5]))
+    return layers
+
+class NumpyPolicy:
+    """
+    Greedy policy of an exported Q network, dense layers run as float32 NumPy matmuls without TF
+    Kernels are stored as float16, as int8 with a float32 scale per output unit, or as float32, in a flat .npz
+    Stands in for a PolicySnapshot and for its model, e.g. as an OpponentPool entry or env.best_model
+    """
+    def __init__(self, arrays):
+        self.arrays = arrays # As saved
+        self.dtype = str(arrays['dtype'])
+        self.layers = []
+        for i in range(int(arrays['n_layers'])):
+            kernel = arrays[f'kernel{i}'].astype(np.float32)
+            if f'scale{i}' in arrays:
+                kernel *= arrays[f'scale{i}']
+            self.layers.append((kernel, arrays[f'bias{i}'].astype(np.float32)))
+        self.state_space = self.layers[0][0].shape[0]
+        self.action_space = self.layers[-1][0].shape[1]
+
+    @classmethod
+    def from_weights(cls, weights, dtype='float16'):
+        arrays = {'dtype': np.array(dtype), 'n_layers': np.array(0)}
+        for i, (kernel, bias) in enumerate(fold_q_network(weights)):
+            if dtype == 'int8':
+                scale = np.abs(kernel).max(axis=0) / 127
+                scale[scale == 0] = 1
+                arrays[f'kernel{i}'] = np.round(kernel / scale).astype(np.int8)
+                arrays[f'scale{i}'] = scale.astype(np.float32)
+            elif dtype in ('float16', 'float32'):
+                arrays[f'kernel{i}'] = kernel.astype(dtype)
+            else:
+                raise ValueError(f'Unknown export dtype {dtype}')
+            arrays[f'bias{i}'] = bias.astype(np.float32)
+            arrays['n_layers'] = np.array(i + 1)
+        return cls(arrays)
+
+    @property
+    def model(self):
+        return self
+
+    def q_values(self, states):
+        x = np.asarray(states, dtype=np.float32).reshape(-1, self.state_space)
+        for i, (kernel, bias) in enumerate(self.layers):
+            x = x @ kernel + bias
+            if i < len(self.layers) - 1:
+                np.maximum(x, 0, out=x) # relu
+        return x
+
+    def act_greedy_batch(self, states):
+        return np.argmax(self.q_values(states), axis=1)
+
+    def act_greedy(self, state):
+        return self.act_greedy_batch(state)[0]
+
+    def act_random(self, rng=random):
+        return rng.sample(range(self.action_space), 1)[0]
+
+    def save(self, filepath):
+        np.savez(filepath, **self.arrays)
+
+def load_policy(filepath):
+    with np.load(filepath) as f:
+        return NumpyPolicy(dict(f))
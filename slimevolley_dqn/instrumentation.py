@@ -0,0 +1,120 @@
+"""# Instrumentation"""
+
+# For display progress
+import time
+
+# For metrics sinks
+import csv
+import json
+import os
+
+class PhaseTimer:
+    """Reusable context manager adding the elapsed wall time to one profiler phase"""
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.profiler.total[self.name] += elapsed
+        self.profiler.interval[self.name] += elapsed
+
+class Profiler:
+    """
+    Cumulative and per interval wall time of the training loop phases, plus env steps and updates per second
+    Usage: with agent.profiler.phase('env'): ..., then report(env_steps) once per interval
+    """
+    PHASES = ('env', 'inference', 'sample', 'train', 'target_sync', 'eval', 'checkpoint')
+
+    def __init__(self, sink=None):
+        self.sink = sink # Optional JsonlSink or CsvSink receiving every report
+        self.total = dict.fromkeys(self.PHASES, 0.0)
+        self.interval = dict.fromkeys(self.PHASES, 0.0)
+        self.timers = {name: PhaseTimer(self, name) for name in self.PHASES}
+        self.updates = 0
+        self.time_start = time.perf_counter()
+        self.interval_start = self.time_start
+        self.interval_env_steps = 0 # Env steps at interval start
+        self.interval_updates = 0 # Updates at interval start
+
+    def phase(self, name):
+        timer = self.timers.get(name)
+        if timer is None: # Phases outside PHASES are added on first use
+            self.total[name] = 0.0
+            self.interval[name] = 0.0
+            timer = self.timers[name] = PhaseTimer(self, name)
+        return timer
+
+    def metrics(self, env_steps):
+        """Structured metrics as a flat dict, does not start a new interval"""
+        now = time.perf_counter()
+        wall = now - self.time_start
+        interval_wall = now - self.interval_start
+        metrics = {'wall_time': wall,
+                   'env_steps': env_steps,
+                   'updates': self.updates,
+                   'env_steps_per_sec': env_steps / wall if wall > 0 else 0.0,
+                   'updates_per_sec': self.updates / wall if wall > 0 else 0.0,
+                   'interval_wall_time': interval_wall,
+                   'interval_env_steps_per_sec': (env_steps - self.interval_env_steps) / interval_wall if interval_wall > 0 else 0.0,
+                   'interval_updates_per_sec': (self.updates - self.interval_updates) / interval_wall if interval_wall > 0 else 0.0}
+        for name in self.total:
+            metrics['time_' + name] = self.total[name]
+        for name in self.interval:
+            metrics['interval_time_' + name] = self.interval[name]
+        metrics['interval_time_other'] = interval_wall - sum(self.interval.values())
+        return metrics
+
+    def report(self, env_steps):
+        """Metrics of the interval since the last report, written to the sink, then start a new interval"""
+        metrics = self.metrics(env_steps)
+        if self.sink is not None:
+            self.sink.write(metrics)
+        for name in self.interval:
+            self.interval[name] = 0.0
+        self.interval_start = time.perf_counter()
+        self.interval_env_steps = env_steps
+        self.interval_updates = self.updates
+        return metrics
+
+def format_profile(metrics):
+    shares = []
+    for name in sorted(Profiler.PHASES, key=lambda name: -metrics['interval_time_' + name]):
+        share = metrics['interval_time_' + name] / metrics['interval_wall_time'] if metrics['interval_wall_time'] > 0 else 0.0
+        shares.append(f'{name} {round(100 * share, 1)}%')
+    return (f"env steps/s: {round(metrics['interval_env_steps_per_sec'], 1)}, "
+            f"updates/s: {round(metrics['interval_updates_per_sec'], 1)}, " + ', '.join(shares))
+
+class JsonlSink:
+    """Append each metrics record as one JSON line"""
+    def __init__(self, filepath):
+        self.filepath = filepath
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+
+    def write(self, record):
+        with open(self.filepath, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+class CsvSink:
+    """Append each metrics record as one CSV row, columns fixed by the first record"""
+    def __init__(self, filepath):
+        self.filepath = filepath
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        self.fieldnames = None
+
+    def write(self, record):
+        new_file = not os.path.exists(self.filepath) or os.path.getsize(self.filepath) == 0
+        if self.fieldnames is None:
+            self.fieldnames = list(record)
+        with open(self.filepath, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.fieldnames, extrasaction='ignore')
+            if new_file:
+                writer.writeheader()
+            writer.writerow(record)
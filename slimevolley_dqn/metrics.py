@@ -0,0 +1,137 @@
+"""# Episode metrics"""
+
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+
+class EpisodeLog:
+    """
+    Per episode metrics of one run, one append-only binary file per column in directory
+    Rows are buffered and flushed every flush_every episodes, load_episode_log reads the columns back
+    wall_time counts seconds of training, continuing from the last row when a run is resumed
+    """
+    COLUMNS = [('episode', np.int64),
+               ('score', np.float64),
+               ('length', np.int64),
+               ('wall_time', np.float64),
+               ('env_steps', np.int64),
+               ('epsilon', np.float64)]
+
+    def __init__(self, directory, flush_every=20):
+        self.directory = directory
+        self.flush_every = flush_every
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'schema.json'), 'w') as f:
+            json.dump({name: np.dtype(dtype).str for name, dtype in self.COLUMNS}, f)
+        self.files = {name: open(os.path.join(directory, name + '.bin'), 'ab') for name, _ in self.COLUMNS}
+        self.pending = 0
+        self._continue_wall_time()
+
+    def _continue_wall_time(self):
+        wall_time = load_episode_log(self.directory)['wall_time']
+        self.start = time.time() - (wall_time[-1] if len(wall_time) else 0)
+
+    def append(self, episode, score, length, env_steps, epsilon):
+        row = (episode, score, length, time.time() - self.start, env_steps, epsilon)
+        for (name, dtype), value in zip(self.COLUMNS, row):
+            self.files[name].write(np.array(value, dtype=dtype).tobytes())
+        self.pending += 1
+        if self.pending >= self.flush_every:
+            self.flush()
+
+    def truncate(self, n_episodes):
+        """Drop rows after the first n_episodes, e.g. episodes played after the checkpoint a run resumes from"""
+        self.flush()
+        for name, dtype in self.COLUMNS:
+            self.files[name].truncate(min(n_episodes * np.dtype(dtype).itemsize, self.files[name].tell()))
+        self._continue_wall_time()
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+        self.pending = 0
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+def load_episode_log(directory):
+    """Columns of an EpisodeLog as arrays, rows half written by an interrupted run are dropped"""
+    with open(os.path.join(directory, 'schema.json')) as f:
+        schema = json.load(f)
+    columns = {}
+    for name, dtype in schema.items():
+        filepath = os.path.join(directory, name + '.bin')
+        columns[name] = np.fromfile(filepath, dtype=dtype) if os.path.exists(filepath) else np.zeros(0, dtype=dtype)
+    n = min(len(column) for column in columns.values())
+    return {name: column[:n] for name, column in columns.items()}
+
+def load_episode_logs(directories):
+    """Episode logs of several runs by directory name"""
+    return {os.path.basename(os.path.normpath(directory)): load_episode_log(directory) for directory in directories}
+
+def rolling_stats(values, window=100):
+    """Mean and std over the trailing window of each element, over the elements so far for the first window - 1"""
+    values = np.asarray(values, dtype=np.float64)
+    csum = np.concatenate([[0], np.cumsum(values)])
+    csum2 = np.concatenate([[0], np.cumsum(values ** 2)])
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - window, 0)
+    count = end - start
+    mean = (csum[end] - csum[start]) / count
+    var = (csum2[end] - csum2[start]) / count - mean ** 2
+    return mean, np.sqrt(np.maximum(var, 0)) # Rounding can make var slightly negative
+
+def aggregate_runs(runs, column='score', x='episode', window=100, n_points=200):
+    """
+    Rolling mean of column in each run, then mean, std and 95% confidence interval over the runs
+    x='episode' aligns runs by episode up to the shortest run,
+    any other column, e.g. 'env_steps' or 'wall_time', is interpolated onto n_points shared values
+    """
+    runs = list(runs.values()) if isinstance(runs, dict) else list(runs)
+    curves = [rolling_stats(run[column], window)[0] for run in runs]
+    if x == 'episode':
+        n = min(len(curve) for curve in curves)
+        xs = np.arange(n)
+        ys = np.stack([curve[:n] for curve in curves])
+    else:
+        # Range covered by every run
+        xs = np.linspace(max(run[x][0] for run in runs), min(run[x][-1] for run in runs), n_points)
+        ys = np.stack([np.interp(xs, run[x], curve) for run, curve in zip(runs, curves)])
+    
+    n_runs = len(runs)
+    mean = ys.mean(axis=0)
+    std = ys.std(axis=0, ddof=1) if n_runs > 1 else np.zeros_like(mean)
+    half_width = 1.96 * std / np.sqrt(n_runs)
+    return {'x': xs, 'mean': mean, 'std': std, 'ci_lo': mean - half_width, 'ci_hi': mean + half_width, 'n_runs': n_runs}
+
+def write_episode_log(directory, columns):
+    """Write whole columns in the EpisodeLog format, e.g. converted from another format"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'schema.json'), 'w') as f:
+        json.dump({name: np.dtype(dtype).str for name, dtype in EpisodeLog.COLUMNS}, f)
+    for name, dtype in EpisodeLog.COLUMNS:
+        np.asarray(columns[name], dtype=dtype).tofile(os.path.join(directory, name + '.bin'))
+
+def convert_score_pickle(filepath, directory):
+    """
+    Convert a notebook result pickle, the episode returns followed by the total timesteps, into an EpisodeLog
+    Columns the notebooks did not record are -1 (integers) or nan, env_steps of the last episode is the total
+    """
+    with open(filepath, 'rb') as f:
+        r_sums = pickle.load(f)
+    scores, timesteps = r_sums[:-1], r_sums[-1]
+    n = len(scores)
+    env_steps = np.full(n, -1)
+    if n > 0:
+        env_steps[-1] = timesteps
+    write_episode_log(directory, {'episode': np.arange(1, n + 1),
+                                  'score': scores,
+                                  'length': np.full(n, -1),
+                                  'wall_time': np.full(n, np.nan),
+                                  'env_steps': env_steps,
+                                  'epsilon': np.full(n, np.nan)})
+    return load_episode_log(directory)
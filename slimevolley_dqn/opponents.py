@@ -0,0 +1,86 @@
+"""# Opponent pool"""
+
+import os
+import random
+from collections import OrderedDict
+
+from .agent import build_q_network
+from .backends import tf
+from .evaluation import PolicySnapshot
+from .inference import NumpyPolicy, load_policy
+
+class OpponentPool:
+    """
+    History of past best self play models, identified by their checkpoint filepath
+    At most max_cached frozen copies are held in memory (least recently used are dropped),
+    others are loaded lazily from their checkpoint when sampled
+    Each episode plays the latest best model with probability latest_prob, else a uniform pick from the history
+    With export_dtype, the frozen copies are NumpyPolicy exports, saved as .npz and loaded back in milliseconds
+    """
+    def __init__(self, state_space, action_space, max_cached=8, latest_prob=0.5, dueling=False, export_dtype=None):
+        self.state_space = state_space
+        self.action_space = action_space
+        self.dueling = dueling # Architecture of the saved models
+        self.export_dtype = export_dtype # 'float16', 'int8' or None for keras copies
+        self.max_cached = max_cached
+        self.latest_prob = latest_prob
+        self.filepaths = [] # Oldest first
+        self.cache = OrderedDict() # filepath -> PolicySnapshot, most recently used last
+
+    def __len__(self):
+        return len(self.filepaths)
+
+    def add(self, filepath, model=None):
+        """Register a new best model, a copy of the weights of model is cached to avoid reloading it"""
+        self.filepaths.append(filepath)
+        if model is not None:
+            self.put(filepath, model.get_weights())
+        return filepath, self.get(filepath)
+
+    def add_checkpoints(self, logdir, pattern='_history_step'):
+        """Register the best models saved in logdir by earlier runs, without loading them"""
+        names = [name for name in os.listdir(logdir) if pattern in name] if os.path.isdir(logdir) else []
+        names.sort(key=lambda name: int(name.split(pattern)[-1].split('.')[0])) # .keras, .npz or a SavedModel directory
+        for name in names:
+            filepath = os.path.join(logdir, name)
+            if filepath not in self.filepaths:
+                self.filepaths.append(filepath)
+
+    def put(self, filepath, weights):
+        if self.export_dtype is not None:
+            snapshot = NumpyPolicy.from_weights(weights, self.export_dtype)
+        else:
+            snapshot = PolicySnapshot(self.state_space, self.action_space, self.dueling)
+            snapshot.load(filepath, weights)
+        return self.cache_snapshot(filepath, snapshot)
+
+    def cache_snapshot(self, filepath, snapshot):
+        self.cache[filepath] = snapshot
+        while len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+        return snapshot
+
+    def get(self, filepath):
+        snapshot = self.cache.get(filepath)
+        if snapshot is not None:
+            self.cache.move_to_end(filepath)
+            return snapshot
+        if filepath.endswith('.npz'):
+            return self.cache_snapshot(filepath, load_policy(filepath))
+        if filepath.endswith('.keras'):
+            # Weights into the known architecture, Keras 3 cannot rebuild the Lambda layer of the dueling head from the file
+            model = build_q_network(self.state_space, self.action_space, learning_rate=0.001, dueling=self.dueling)
+            model.load_weights(filepath)
+        else: # SavedModel directory of an earlier version
+            model = tf.keras.models.load_model(filepath, compile=False)
+        return self.put(filepath, model.get_weights())
+
+    def latest(self):
+        filepath = self.filepaths[-1]
+        return filepath, self.get(filepath)
+
+    def sample(self, rng=random):
+        if rng.random() < self.latest_prob:
+            return self.latest()
+        filepath = rng.choice(self.filepaths)
+        return filepath, self.get(filepath)
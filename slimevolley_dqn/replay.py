@@ -0,0 +1,396 @@
+"""# Replay memory"""
+
+import os
+
+# For reading ahead replay minibatches
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+class ReplayMemory:
+    """
+    Circular experience replay buffer on preallocated, column-oriented arrays
+    Each observation is stored once, the next state of slot i lives in slot i + stride,
+    where stride is the number of envs pushing one transition each per add_batch call
+    With n_step transitions from an NStepBuffer, the next state s_t+n lives n_step blocks later, in slot i + n_step * stride
+    """
+    def __init__(self, capacity, state_space, stride=1, storage=None, n_step=1):
+        self.stride = stride
+        self.n_step = n_step
+        self.lookahead = n_step * stride # Slots from a state to its next state
+        self.capacity = capacity - capacity % stride # Keep env blocks from wrapping around the end
+        
+        if storage is None:
+            self.states = np.zeros((self.capacity, state_space), dtype=np.float32)
+            self.actions = np.zeros(self.capacity, dtype=np.uint8)
+            self.rewards = np.zeros(self.capacity, dtype=np.float32)
+            self.dones = np.zeros(self.capacity, dtype=np.bool_)
+        else: # Arrays allocated elsewhere, e.g. views into shared memory
+            self.states, self.actions, self.rewards, self.dones = storage
+        
+        self.ptr = 0 # Next slot to write
+        self.size = 0 # Number of stored transitions
+        self.n_added = 0 # Transitions ever added, tells checkpoints which slots changed
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, done):
+        self.add_batch(np.reshape(state, (1, -1)), [action], [reward], np.reshape(next_state, (1, -1)), [done])
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        """
+        Write one transition per env, next states go into the block n_step blocks ahead
+        and are overwritten by a later call with identical states (or do not matter if done)
+        """
+        n = len(actions)
+        if n != self.stride:
+            raise ValueError(f'Expected {self.stride} transitions per add_batch, got {n}')
+        
+        block = slice(self.ptr, self.ptr + n)
+        self.states[block] = states
+        self.actions[block] = actions
+        self.rewards[block] = rewards
+        self.dones[block] = dones
+        
+        self.ptr = (self.ptr + n) % self.capacity
+        pending = (self.ptr + self.lookahead - n) % self.capacity
+        self.states[pending:pending + n] = next_states # Pending next states
+        self.size = min(self.size + n, self.capacity)
+        self.n_added += n
+
+    def n_valid(self):
+        """Number of sampleable slots, the n_step blocks from ptr on only hold pending next states once they wrap around"""
+        return min(self.size, self.capacity - self.lookahead)
+
+    def sample_indices(self, batch_size):
+        # The n_valid slots before ptr
+        n_valid = self.n_valid()
+        offsets = np.random.randint(0, n_valid, size=batch_size)
+        return (self.ptr - n_valid + offsets) % self.capacity
+
+    def get(self, idx):
+        next_idx = (idx + self.lookahead) % self.capacity
+        return (self.states[idx], 
+                self.actions[idx], 
+                self.rewards[idx], 
+                self.states[next_idx], 
+                self.dones[idx])
+
+    def sample(self, batch_size):
+        """Return s a r s' done arrays of a uniformly sampled minibatch"""
+        return self.get(self.sample_indices(batch_size))
+
+    def importance_weights(self, idx):
+        return np.ones(len(idx), dtype=np.float32) # Uniform sampling, no correction
+
+    def update_priorities(self, idx, td_errors):
+        pass # Uniform sampling, nothing to update
+
+    def columns(self):
+        """Per slot arrays, checkpoints write only the slots changed since the previous one"""
+        return {'states': self.states, 'actions': self.actions, 'rewards': self.rewards, 'dones': self.dones}
+
+    def written_since(self, n_added):
+        """Slot ranges written since n_added transitions were added, including the pending next state blocks"""
+        n = self.n_added - n_added + self.lookahead
+        if n >= self.capacity:
+            return [slice(0, self.capacity)]
+        start = (self.ptr + self.lookahead - n) % self.capacity
+        if start + n <= self.capacity:
+            return [slice(start, start + n)]
+        return [slice(start, self.capacity), slice(0, start + n - self.capacity)]
+
+    def checkpoint_state(self):
+        """Counters and the arrays written in full by every checkpoint"""
+        return {'ptr': int(self.ptr), 'size': int(self.size), 'n_added': int(self.n_added)}, {}
+
+    def load_checkpoint_state(self, counters, arrays):
+        self.ptr = counters['ptr']
+        self.size = counters['size']
+        self.n_added = counters['n_added']
+        # The envs restart after a restore, so the next states still pending are overwritten by the new episodes,
+        # the transitions waiting for them end there like at a done
+        pending = (self.ptr - np.arange(1, min(self.size, self.lookahead) + 1)) % self.capacity
+        self.dones[pending] = True
+
+class SumTree:
+    """
+    Array based binary tree where each node holds the sum of its children
+    Leaves are the priorities of the replay slots, updates and sampling are batched over levels
+    """
+    def __init__(self, capacity):
+        self.n_leaves = 1
+        while self.n_leaves < capacity:
+            self.n_leaves *= 2
+        self.tree = np.zeros(2 * self.n_leaves, dtype=np.float64) # Node 1 is the root
+        
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def get(self, idx):
+        return self.tree[idx + self.n_leaves]
+
+    def update(self, idx, priorities):
+        nodes = np.asarray(idx) + self.n_leaves
+        self.tree[nodes] = priorities
+        # Recompute parents one level at a time, duplicates write the same sum
+        while nodes[0] > 1:
+            nodes = nodes // 2
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """Leaf index of each prefix sum value, descending all values together"""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.n_leaves:
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values > left_sum
+            values -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.n_leaves
+
+class PrioritizedReplayMemory(ReplayMemory):
+    """
+    Proportional prioritized experience replay, Schaul et al. 2016
+    Slots are sampled with probability p^alpha / sum p^alpha through a SumTree,
+    importance sampling weights use beta annealed linearly to 1 over beta_steps sample calls
+    """
+    def __init__(self, capacity, state_space, stride=1, alpha=0.6, beta=0.4, beta_steps=100000, priority_eps=1e-6, storage=None,
+                 n_step=1):
+        super(PrioritizedReplayMemory, self).__init__(capacity, state_space, stride, storage, n_step)
+        self.alpha = alpha
+        self.beta_start = beta
+        self.beta = beta
+        self.beta_steps = beta_steps
+        self.priority_eps = priority_eps # Keeps transitions with zero TD error sampleable
+        
+        self.tree = SumTree(self.capacity)
+        self.max_priority = 1.0 # New transitions get the highest priority seen so far
+        self.n_sampled = 0
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        block = np.arange(self.ptr, self.ptr + len(actions))
+        super(PrioritizedReplayMemory, self).add_batch(states, actions, rewards, next_states, dones)
+        # Slots holding pending next states are not valid transitions, one tree update for both blocks
+        pending = (self.ptr + self.lookahead - self.stride + np.arange(self.stride)) % self.capacity
+        priorities = np.zeros(2 * self.stride)
+        priorities[:self.stride] = self.max_priority
+        self.tree.update(np.concatenate([block, pending]), priorities)
+
+    def sample_indices(self, batch_size):
+        self.n_sampled += 1
+        self.beta = min(1.0, self.beta_start + (1 - self.beta_start) * self.n_sampled / self.beta_steps)
+        
+        # Stratified, one value from each of batch_size equal segments of the total priority
+        segment = self.tree.total / batch_size
+        values = (np.arange(batch_size) + np.random.rand(batch_size)) * segment
+        idx = self.tree.find(values)
+        
+        # Rounding at segment edges can land on an empty leaf, fall back to uniform for those
+        empty = self.tree.get(idx) <= 0
+        if np.any(empty):
+            idx[empty] = super(PrioritizedReplayMemory, self).sample_indices(np.count_nonzero(empty))
+        return idx
+
+    def importance_weights(self, idx):
+        n_valid = self.n_valid()
+        probs = self.tree.get(idx) / self.tree.total
+        weights = (n_valid * probs) ** (-self.beta)
+        return (weights / weights.max()).astype(np.float32) # Normalize so weights only scale updates down
+
+    def update_priorities(self, idx, td_errors):
+        priorities = (np.abs(td_errors) + self.priority_eps) ** self.alpha
+        self.tree.update(idx, priorities)
+        self.max_priority = max(self.max_priority, priorities.max())
+
+    def checkpoint_state(self):
+        counters, arrays = super(PrioritizedReplayMemory, self).checkpoint_state()
+        counters.update(max_priority=float(self.max_priority), n_sampled=int(self.n_sampled), beta=float(self.beta))
+        # Priorities change anywhere in the buffer between checkpoints, always written in full
+        arrays['priorities'] = self.tree.get(np.arange(self.capacity))
+        return counters, arrays
+
+    def load_checkpoint_state(self, counters, arrays):
+        super(PrioritizedReplayMemory, self).load_checkpoint_state(counters, arrays)
+        self.max_priority = counters['max_priority']
+        self.n_sampled = counters['n_sampled']
+        self.beta = counters['beta']
+        self.tree.update(np.arange(self.capacity), arrays['priorities'])
+
+def open_replay_columns(directory, capacity, state_space, mode='w+'):
+    """
+    states, actions, rewards, dones of a replay memory as np.memmap backed .npy files in directory
+    mode is as for np.memmap, 'w+' creates the files, 'r+' opens existing ones to keep writing, 'r' read only
+    """
+    if mode == 'w+':
+        os.makedirs(directory, exist_ok=True)
+    specs = [('states', np.float32, (capacity, state_space)),
+             ('actions', np.uint8, (capacity,)),
+             ('rewards', np.float32, (capacity,)),
+             ('dones', np.bool_, (capacity,))]
+    columns = []
+    for name, dtype, shape in specs:
+        filepath = os.path.join(directory, name + '.npy')
+        if mode == 'w+':
+            column = np.lib.format.open_memmap(filepath, mode='w+', dtype=dtype, shape=shape)
+        else:
+            column = np.load(filepath, mmap_mode=mode)
+            if column.shape != shape or column.dtype != dtype:
+                raise ValueError(f'{filepath} holds {column.dtype} {column.shape}, expected {np.dtype(dtype)} {shape}')
+        columns.append(column)
+    return tuple(columns)
+
+class MemmapReplayMemory(ReplayMemory):
+    """
+    ReplayMemory on np.memmap files, for buffers larger than RAM or read by several processes
+    Sampled indices are sorted so a minibatch is read in file order, only the touched pages are loaded
+    A read-ahead thread samples and reads the next minibatch while the current one trains,
+    sampling skips the guard slots after the write pointer, which adds may overwrite before the batch is used
+    Other processes open the same directory with mode='r' and sample the transitions as they are written
+    """
+    def __init__(self, capacity, state_space, directory, stride=1, mode='w+', guard=0, prefetch=True, n_step=1):
+        capacity = capacity - capacity % stride
+        storage = open_replay_columns(directory, capacity, state_space, mode)
+        super(MemmapReplayMemory, self).__init__(capacity, state_space, stride, storage, n_step)
+        self.directory = directory
+        self.readonly = mode == 'r'
+        self.guard = min(guard, self.capacity // 4) # Keep most of the buffer sampleable
+        
+        counters = os.path.join(directory, 'counters.npy')
+        if mode == 'w+':
+            self.counters = np.lib.format.open_memmap(counters, mode='w+', dtype=np.int64, shape=(3,)) # ptr, size, n_added
+        else:
+            self.counters = np.load(counters, mmap_mode=mode)
+            self.refresh()
+        
+        self.rng = np.random.default_rng(np.random.randint(2**31)) # The read-ahead thread must not share np.random
+        self.executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        self.pending = None # Future of the next (idx, batch)
+        self.prefetched = None # (idx, batch) handed out by sample_indices, returned by get
+
+    def refresh(self):
+        """Read the counters published by the writing process"""
+        self.ptr, self.size, self.n_added = (int(c) for c in self.counters)
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        super(MemmapReplayMemory, self).add_batch(states, actions, rewards, next_states, dones)
+        self.counters[:] = (self.ptr, self.size, self.n_added) # Published after the data, readers never sample unwritten slots
+
+    def load_checkpoint_state(self, counters, arrays):
+        super(MemmapReplayMemory, self).load_checkpoint_state(counters, arrays)
+        self.counters[:] = (self.ptr, self.size, self.n_added)
+
+    def sample_ahead(self, batch_size):
+        """Uniform sorted indices, excluding the pending blocks and the guard slots after them"""
+        end = self.ptr + self.lookahead + self.guard # Slots up to end may be written before the batch is used
+        if self.size < self.capacity:
+            low = max(0, end - self.capacity)
+            idx = self.rng.integers(low if low < self.size else 0, self.size, size=batch_size)
+        else:
+            idx = (end + self.rng.integers(0, self.capacity - self.lookahead - self.guard, size=batch_size)) % self.capacity
+        return np.sort(idx)
+
+    def read_ahead(self, batch_size):
+        idx = self.sample_ahead(batch_size)
+        return idx, ReplayMemory.get(self, idx)
+
+    def sample_indices(self, batch_size):
+        if self.readonly:
+            self.refresh()
+        if self.executor is None:
+            return self.sample_ahead(batch_size)
+        
+        idx = None
+        if self.pending is not None:
+            idx, batch = self.pending.result()
+        if idx is None or len(idx) != batch_size:
+            idx, batch = self.read_ahead(batch_size)
+        self.prefetched = (idx, batch)
+        self.pending = self.executor.submit(self.read_ahead, batch_size) # Next minibatch, read while this one trains
+        return idx
+
+    def get(self, idx):
+        if self.prefetched is not None and idx is self.prefetched[0]:
+            batch = self.prefetched[1]
+            self.prefetched = None
+            return batch
+        return super(MemmapReplayMemory, self).get(idx)
+
+    def flush(self):
+        if not self.readonly:
+            for column in self.columns().values():
+                column.flush()
+            self.counters.flush()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.pending = None
+        self.flush()
+
+"""## N-step returns"""
+
+class NStepBuffer:
+    """
+    Builds n-step transitions in front of the replay memory, from a rolling window of the last n_step steps of each env
+    (s_t, a_t, r_t + gamma r_t+1 + ... + gamma^(n-1) r_t+n-1, s_t+n, done), so the target bootstraps with gamma^n;
+    a done within the window truncates the return there and the transition is done, it is not bootstrapped
+    push_batch emits the transition of the oldest step of every env once the windows are full, one block per call,
+    n_step - 1 calls late, so the replay keeps one transition per env per block in step order
+    push is the single env version, which also flushes the rest of the window when the episode is done
+    """
+    def __init__(self, n_step, gamma, state_space, n_envs=1):
+        self.n_step = n_step
+        self.discounts = (gamma ** np.arange(n_step)).astype(np.float32)[:, None]
+        self.states = np.zeros((n_step, n_envs, state_space), dtype=np.float32)
+        self.actions = np.zeros((n_step, n_envs), dtype=np.int64)
+        self.rewards = np.zeros((n_step, n_envs), dtype=np.float32)
+        self.dones = np.zeros((n_step, n_envs), dtype=np.bool_)
+        self.next_states = np.zeros((n_envs, state_space), dtype=np.float32) # Of the newest step
+        self.head = 0 # Window slot of the oldest step
+        self.count = 0 # Steps in the windows
+
+    def __len__(self):
+        return self.count
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        """Add one step of every env, return the n-step transitions of the oldest step, None while the windows fill"""
+        i = (self.head + self.count) % self.n_step
+        self.states[i] = states
+        self.actions[i] = actions
+        self.rewards[i] = rewards
+        self.dones[i] = dones
+        self.next_states[:] = next_states
+        self.count += 1
+        if self.count < self.n_step:
+            return None
+        return self.pop()
+
+    def pop(self):
+        """Transitions of the oldest step, with the return over the steps in the windows"""
+        order = (self.head + np.arange(self.count)) % self.n_step
+        rewards, dones = self.rewards[order], self.dones[order]
+        # Rewards count until the first done, later steps belong to the next episode
+        alive = np.ones_like(dones)
+        alive[1:] = np.cumprod(~dones[:-1], axis=0)
+        returns = np.sum(self.discounts[:self.count] * rewards * alive, axis=0)
+        transition = (self.states[self.head].copy(), self.actions[self.head].copy(), returns, self.next_states.copy(), dones.any(axis=0))
+        self.head = (self.head + 1) % self.n_step
+        self.count -= 1
+        return transition
+
+    def push(self, state, action, reward, next_state, done):
+        """Single env, return the list of completed (s, a, R, s', done), all steps of the window once done"""
+        batch = self.push_batch(np.reshape(state, (1, -1)), [action], [reward], np.reshape(next_state, (1, -1)), [done])
+        batches = [batch] if batch is not None else []
+        if done:
+            while self.count > 0: # Flush, the episode ended within the window of each of these steps
+                batches.append(self.pop())
+        return [tuple(column[0] for column in batch) for batch in batches]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
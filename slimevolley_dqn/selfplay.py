@@ -0,0 +1,37 @@
+"""# Self play training env"""
+
+import random
+
+import slimevolleygym
+
+from .inference import greedy_actions
+
+class SlimeVolleySelfPlayEnv(slimevolleygym.SlimeVolleyEnv):
+    """
+    Ref: https://github.com/hardmaru/slimevolleygym/blob/master/training_scripts/train_ppo_selfplay.py
+    wrapper over the normal single player env, but loads the best self play model
+    before finding the first best model, policy is random
+    With an OpponentPool, sample_opponent picks a frozen past best model for the next episode
+    """
+    def __init__(self, opponent_pool=None):
+        super(SlimeVolleySelfPlayEnv, self).__init__()
+        self.policy = self
+        self.best_model = None
+        self.best_model_filepath = None
+        self.opponent_pool = opponent_pool
+
+    def sample_opponent(self, rng=random):
+        if self.opponent_pool is not None and len(self.opponent_pool) > 0:
+            self.best_model_filepath, snapshot = self.opponent_pool.sample(rng)
+            self.best_model = snapshot.model
+
+    def use_latest_opponent(self):
+        if self.opponent_pool is not None and len(self.opponent_pool) > 0:
+            self.best_model_filepath, snapshot = self.opponent_pool.latest()
+            self.best_model = snapshot.model
+    
+    def predict(self, state, rng=random): # The environment policy based on the best model
+        if self.best_model is None:
+            return rng.sample(range(8), 1)[0] # Return a random action code in action space
+        else:
+            return greedy_actions(self.best_model, state)[0] # Use the best model to return action
@@ -0,0 +1,298 @@
+"""
+# Batched SlimeVolley simulator
+Imports slimevolleygym for its game constants and baseline policy, the rest of the package reaches this module lazily
+"""
+
+import random
+from collections import OrderedDict
+
+import numpy as np
+import slimevolleygym
+from gym import spaces
+from gym.utils import seeding
+
+from .inference import greedy_actions
+
+# Game constants of the reference env, so the simulator cannot drift from it
+from slimevolleygym.slimevolley import (REF_W, REF_H, REF_U, REF_WALL_WIDTH, REF_WALL_HEIGHT, PLAYER_SPEED_X, PLAYER_SPEED_Y,
+                                        MAX_BALL_SPEED, TIMESTEP, NUDGE, FRICTION, INIT_DELAY_FRAMES, GRAVITY, MAXLIVES)
+
+AGENT_RADIUS = 1.5
+BALL_RADIUS = 0.5
+FENCE_STUB_RADIUS = REF_WALL_WIDTH/2
+AGENT_DIR = np.array([-1, 1]) # Column 0 is the left agent (opponent), column 1 the right agent (trained)
+
+# action_inverse as a lookup table, converts a batch of action codes at once
+ACTION_TABLE = np.array([[0,0,0], [1,0,0], [0,1,0], [0,0,1], [1,1,0], [1,0,1], [0,1,1], [1,1,1]])
+
+class BatchSlimeVolleyEnv:
+    """
+    NumPy port of slimevolleygym.SlimeVolleyEnv that advances n_games games with one set of array operations
+    Movement, ball physics, collisions, scoring, lives, time limit and the baseline RNN opponent follow the reference
+    operation for operation, so a game seeded like a SlimeVolleyEnv plays the same trajectory for the same actions
+    step takes (n_games, 3) multibinary actions or (n_games,) action codes and returns arrays, one row per game
+    Games are not reset automatically, reset(idx) starts new episodes in some of the games
+    """
+    t_limit = 3000
+
+    def __init__(self, n_games):
+        self.n_games = n_games
+        high = np.array([np.finfo(np.float32).max] * 12)
+        self.observation_space = spaces.Box(-high, high)
+        self.action_space = spaces.MultiBinary(3)
+        self.rngs = [np.random] * n_games # Unseeded games draw from the global numpy state, as the reference does
+        self.t = np.zeros(n_games, dtype=np.int64)
+        self.delay = np.zeros(n_games, dtype=np.int64) # Frames the ball is still held after a serve
+        # Agents, one column per side
+        self.x = np.zeros((n_games, 2))
+        self.y = np.zeros((n_games, 2))
+        self.vx = np.zeros((n_games, 2))
+        self.vy = np.zeros((n_games, 2))
+        self.desired_vx = np.zeros((n_games, 2))
+        self.desired_vy = np.zeros((n_games, 2))
+        self.life = np.zeros((n_games, 2), dtype=np.int64)
+        # Ball
+        self.bx = np.zeros(n_games)
+        self.by = np.zeros(n_games)
+        self.bvx = np.zeros(n_games)
+        self.bvy = np.zeros(n_games)
+        self.prev_bx = np.zeros(n_games)
+        # Observation of each side in its own perspective, kept like RelativeState between updates
+        self.obs = np.zeros((n_games, 2, 12))
+        # Baseline RNN outputs, not reset between episodes, like the policy of the reference env
+        baseline = slimevolleygym.BaselinePolicy()
+        self.baseline_weight = baseline.weight
+        self.baseline_bias = baseline.bias
+        self.baseline_output = np.zeros((n_games, baseline.nOutput))
+        self.reset()
+
+    def __len__(self):
+        return self.n_games
+
+    def seed(self, seed=None, idx=None):
+        """Seed the games idx (default all), game idx[j] gets seed + j as if it were SlimeVolleyEnv.seed(seed + j)"""
+        idx = np.arange(self.n_games) if idx is None else np.atleast_1d(idx)
+        seeds = []
+        for j, i in enumerate(idx):
+            self.rngs[i], game_seed = seeding.np_random(None if seed is None else seed + j)
+            seeds.append(game_seed)
+        self.new_game(idx) # The reference builds a new Game on seed, which serves once
+        return seeds
+
+    def reset(self, idx=None):
+        """Start new episodes in the games idx (default all), returns their observations"""
+        idx = np.arange(self.n_games) if idx is None else idx
+        self.t[idx] = 0
+        self.new_game(np.atleast_1d(idx))
+        return self.obs[idx, 1].copy()
+
+    def new_game(self, games):
+        """Game.reset, agents back in place with full lives and a new serve"""
+        self.x[games] = [-REF_W/4, REF_W/4]
+        self.y[games] = 1.5
+        self.vx[games] = 0
+        self.vy[games] = 0
+        self.desired_vx[games] = 0
+        self.desired_vy[games] = 0
+        self.life[games] = MAXLIVES
+        self.serve(games)
+        self.update_state(np.isin(np.arange(self.n_games), games))
+
+    def serve(self, games):
+        """New ball with random velocity held for INIT_DELAY_FRAMES, Game.newMatch"""
+        for i in games:
+            self.bvx[i] = self.rngs[i].uniform(low=-20, high=20)
+            self.bvy[i] = self.rngs[i].uniform(low=10, high=25)
+        self.bx[games] = 0
+        self.by[games] = REF_W/4
+        self.prev_bx[games] = 0
+        self.delay[games] = INIT_DELAY_FRAMES
+
+    def predict(self, states):
+        """
+        Baseline RNN policy for every game, from the observations of the left agent, returns multibinary actions
+        The batched matrix product may round the last bit differently from the reference, the actions agree
+        """
+        inputs = np.concatenate([states[:, :8], self.baseline_output], axis=1)
+        self.baseline_output = np.tanh(inputs @ self.baseline_weight.T + self.baseline_bias)
+        return (self.baseline_output[:, :3] > 0.75).astype(np.int64)
+
+    def step(self, actions, other_actions=None):
+        """
+        Advance every game by one frame, the left agent plays predict unless other_actions is given
+        Returns observations, rewards, dones and info arrays with the keys of the reference info dict
+        """
+        self.t += 1
+        if other_actions is None:
+            other_actions = self.predict(self.obs[:, 0])
+        self.set_actions(0, other_actions)
+        self.set_actions(1, actions)
+        
+        reward = self.step_game()
+        
+        done = (self.t >= self.t_limit) | np.any(self.life <= 0, axis=1)
+        obs = self.obs[:, 1].copy()
+        info = {'ale.lives': self.life[:, 1].copy(),
+                'ale.otherLives': self.life[:, 0].copy(),
+                'otherObs': self.obs[:, 0].copy(),
+                'state': obs.copy(),
+                'otherState': self.obs[:, 0].copy()}
+        return obs, reward, done, info
+
+    def set_actions(self, side, actions):
+        actions = np.asarray(actions)
+        if actions.ndim == 1:
+            actions = ACTION_TABLE[actions]
+        forward = actions[:, 0] > 0
+        backward = actions[:, 1] > 0
+        self.desired_vx[:, side] = np.where(forward & ~backward, -PLAYER_SPEED_X, np.where(backward & ~forward, PLAYER_SPEED_X, 0))
+        self.desired_vy[:, side] = np.where(actions[:, 2] > 0, PLAYER_SPEED_Y, 0)
+
+    def step_game(self):
+        """Game.step for all games, returns the reward of the right agent"""
+        # Agents, Agent.update
+        self.vy += GRAVITY * TIMESTEP
+        grounded = self.y <= REF_U + NUDGE*TIMESTEP
+        self.vy[grounded] = self.desired_vy[grounded]
+        self.vx = self.desired_vx*AGENT_DIR
+        self.x += self.vx * TIMESTEP
+        self.y += self.vy * TIMESTEP
+        landed = self.y <= REF_U
+        self.y[landed] = REF_U
+        self.vy[landed] = 0
+        at_fence = self.x*AGENT_DIR <= (REF_WALL_WIDTH/2+AGENT_RADIUS) # Stay in their own half
+        self.vx[at_fence] = 0
+        self.x = np.where(at_fence, AGENT_DIR*(REF_WALL_WIDTH/2+AGENT_RADIUS), self.x)
+        at_wall = self.x*AGENT_DIR >= (REF_W/2-AGENT_RADIUS)
+        self.vx[at_wall] = 0
+        self.x = np.where(at_wall, AGENT_DIR*(REF_W/2-AGENT_RADIUS), self.x)
+        
+        # Ball, after the serve delay
+        moving = self.delay == 0
+        self.delay[~moving] -= 1
+        self.bvy[moving] += GRAVITY * TIMESTEP
+        mag2 = self.bvx*self.bvx+self.bvy*self.bvy
+        fast = moving & (mag2 > (MAX_BALL_SPEED*MAX_BALL_SPEED))
+        mag = np.sqrt(mag2[fast])
+        self.bvx[fast] = self.bvx[fast] / mag * MAX_BALL_SPEED
+        self.bvy[fast] = self.bvy[fast] / mag * MAX_BALL_SPEED
+        self.prev_bx[moving] = self.bx[moving]
+        self.bx[moving] += self.bvx[moving] * TIMESTEP
+        self.by[moving] += self.bvy[moving] * TIMESTEP
+        
+        self.bounce(self.x[:, 0], self.y[:, 0], self.vx[:, 0], self.vy[:, 0], AGENT_RADIUS)
+        self.bounce(self.x[:, 1], self.y[:, 1], self.vx[:, 1], self.vy[:, 1], AGENT_RADIUS)
+        self.bounce(0, REF_WALL_HEIGHT, 0, 0, FENCE_STUB_RADIUS)
+        
+        reward = -self.check_edges()
+        
+        scored = np.flatnonzero(reward != 0)
+        self.serve(scored)
+        self.life[reward < 0, 1] -= 1 # Right agent lost the point
+        self.life[reward > 0, 0] -= 1
+        self.update_state(reward == 0) # Observations are not updated in the frame of a point
+        return reward
+
+    def bounce(self, px, py, pvx, pvy, radius):
+        """Particle.bounce of the ball off a circle, for the games where they collide"""
+        r = BALL_RADIUS+radius
+        def colliding(games, px, py):
+            dy = py - self.by[games]
+            dx = px - self.bx[games]
+            return r*r > (dx*dx+dy*dy)
+        games = np.flatnonzero(colliding(slice(None), px, py))
+        if len(games) == 0:
+            return
+        px, py, pvx, pvy = (np.broadcast_to(p, self.bx.shape)[games] for p in (px, py, pvx, pvy))
+        abx = self.bx[games]-px
+        aby = self.by[games]-py
+        abd = np.sqrt(abx*abx+aby*aby)
+        nx = abx / abd
+        ny = aby / abd
+        abx = nx * NUDGE
+        aby = ny * NUDGE
+        pushed = np.ones(len(games), dtype=np.bool_)
+        while np.any(pushed): # Push the ball out along the normal
+            self.bx[games[pushed]] += abx[pushed]
+            self.by[games[pushed]] += aby[pushed]
+            pushed &= colliding(games, px, py)
+        ux = self.bvx[games] - pvx
+        uy = self.bvy[games] - pvy
+        un = ux*nx + uy*ny
+        ux -= nx*(un*2.)
+        uy -= ny*(un*2.)
+        self.bvx[games] = ux + pvx
+        self.bvy[games] = uy + pvy
+
+    def check_edges(self):
+        """Particle.checkEdges of the ball, -1 where it lands on the right side, 1 on the left side"""
+        hit = self.bx<=(BALL_RADIUS-REF_W/2)
+        self.bvx[hit] *= -FRICTION
+        self.bx[hit] = BALL_RADIUS-REF_W/2+NUDGE*TIMESTEP
+        hit = self.bx >= (REF_W/2-BALL_RADIUS)
+        self.bvx[hit] *= -FRICTION
+        self.bx[hit] = REF_W/2-BALL_RADIUS-NUDGE*TIMESTEP
+        
+        ground = self.by<=(BALL_RADIUS+REF_U)
+        self.bvy[ground] *= -FRICTION
+        self.by[ground] = BALL_RADIUS+REF_U+NUDGE*TIMESTEP
+        result = np.where(ground, np.where(self.bx <= 0, -1, 1), 0)
+        
+        hit = ~ground & (self.by >= (REF_H-BALL_RADIUS))
+        self.bvy[hit] *= -FRICTION
+        self.by[hit] = REF_H-BALL_RADIUS-NUDGE*TIMESTEP
+        # Fence
+        hit = ~ground & (self.bx <= (REF_WALL_WIDTH/2+BALL_RADIUS)) & (self.prev_bx > (REF_WALL_WIDTH/2+BALL_RADIUS)) & (self.by <= REF_WALL_HEIGHT)
+        self.bvx[hit] *= -FRICTION
+        self.bx[hit] = REF_WALL_WIDTH/2+BALL_RADIUS+NUDGE*TIMESTEP
+        hit = ~ground & (self.bx >= (-REF_WALL_WIDTH/2-BALL_RADIUS)) & (self.prev_bx < (-REF_WALL_WIDTH/2-BALL_RADIUS)) & (self.by <= REF_WALL_HEIGHT)
+        self.bvx[hit] *= -FRICTION
+        self.bx[hit] = -REF_WALL_WIDTH/2-BALL_RADIUS-NUDGE*TIMESTEP
+        return result
+
+    def update_state(self, games):
+        """Agent.updateState of both sides in the games mask, x axis mirrored so each agent sees itself on the right"""
+        state = np.empty_like(self.obs)
+        state[..., 0] = self.x*AGENT_DIR
+        state[..., 1] = self.y
+        state[..., 2] = self.vx*AGENT_DIR
+        state[..., 3] = self.vy
+        state[..., 4] = self.bx[:, None]*AGENT_DIR
+        state[..., 5] = self.by[:, None]
+        state[..., 6] = self.bvx[:, None]*AGENT_DIR
+        state[..., 7] = self.bvy[:, None]
+        state[..., 8:] = state[:, ::-1, :4] # The opponent as seen from the other side is its own view, mirrored
+        np.copyto(self.obs, state / 10.0, where=games[:, None, None])
+
+class BatchSlimeVolleySelfPlayEnv(BatchSlimeVolleyEnv):
+    """
+    Batched SlimeVolleySelfPlayEnv, the left agent of each game plays its own best model, a random policy while None
+    sample_opponent(i) draws the opponent of game i from the shared OpponentPool for its next episode
+    """
+    def __init__(self, n_games, opponent_pool=None):
+        super(BatchSlimeVolleySelfPlayEnv, self).__init__(n_games)
+        self.best_models = [None] * n_games
+        self.best_model_filepaths = [None] * n_games
+        self.opponent_pool = opponent_pool
+
+    def sample_opponent(self, i, rng=random):
+        if self.opponent_pool is not None and len(self.opponent_pool) > 0:
+            self.best_model_filepaths[i], snapshot = self.opponent_pool.sample(rng)
+            self.best_models[i] = snapshot.model
+
+    def set_best_model(self, model):
+        self.best_models = [model] * self.n_games
+
+    def predict(self, states, rng=random):
+        """Action codes of the opponents, one batched forward pass per distinct best model"""
+        actions = np.zeros(self.n_games, dtype=np.int64)
+        groups = OrderedDict()
+        for i, model in enumerate(self.best_models):
+            groups.setdefault(id(model), []).append(i)
+        for idx in groups.values():
+            opponent = self.best_models[idx[0]]
+            if opponent is None:
+                actions[idx] = [rng.sample(range(8), 1)[0] for _ in idx] # Random policy
+            else:
+                actions[idx] = greedy_actions(opponent, states[idx])
+        return actions
@@ -0,0 +1,141 @@
+"""# Tournament"""
+
+import numpy as np
+
+from .backends import simulator
+from .inference import greedy_actions
+from .utils import action_inverse
+
+def batch_policy(policy, action_space=8, rng=None):
+    """
+    Function from a batch of states to greedy action codes
+    policy is an agent or PolicySnapshot (act_greedy_batch), a keras model, 'random', or 'baseline' (None returned,
+    the env plays its built-in policy on that side)
+    """
+    if isinstance(policy, str):
+        if policy == 'baseline':
+            return None
+        if policy == 'random':
+            rng = rng or np.random.default_rng()
+            return lambda states: rng.integers(0, action_space, size=len(states))
+        raise ValueError(f'Unknown policy {policy}')
+    if hasattr(policy, 'act_greedy_batch'):
+        return policy.act_greedy_batch
+    return lambda states: greedy_actions(policy, states)
+
+def play_games(policy0, policy1, n_games=100, init_seed=123, n_parallel=None, make_env=None):
+    """
+    Play n_games of policy0 against policy1 with n_parallel games stepped together, by default all games at once
+    Each tick, each side picks actions for all running games with one batched forward pass
+    Game i uses env seed init_seed + i, as the evaluate_* rollouts do
+    Games run in one BatchSlimeVolleyEnv, or in one env per parallel game from make_env
+    Returns the score of each game for policy0
+    """
+    n_parallel = min(n_parallel or n_games, n_games)
+    rng = np.random.default_rng(init_seed)
+    act0 = batch_policy(policy0, rng=rng)
+    act1 = batch_policy(policy1, rng=rng)
+    if act0 is None:
+        raise ValueError('The baseline policy can only play the second side')
+    
+    batch_env = simulator.BatchSlimeVolleyEnv(n_parallel) if make_env is None else None
+    envs = [make_env() for _ in range(n_parallel)] if make_env is not None else None
+    state_space = (batch_env if batch_env is not None else envs[0]).observation_space.shape[0]
+    states = np.zeros((n_parallel, state_space), dtype=np.float32)
+    other_states = np.zeros((n_parallel, state_space), dtype=np.float32)
+    games = np.full(n_parallel, -1) # Game played by each env, -1 when idle
+    scores = np.zeros(n_games)
+    next_game = 0
+    
+    def start(k):
+        nonlocal next_game
+        if next_game >= n_games:
+            games[k] = -1
+            return
+        games[k] = next_game
+        if batch_env is not None:
+            batch_env.seed(init_seed + next_game, k)
+            states[k] = batch_env.reset(k)
+        else:
+            envs[k].seed(init_seed + next_game)
+            states[k] = envs[k].reset()
+        other_states[k] = states[k] # Same first observation as rollout_agents
+        next_game += 1
+    
+    for k in range(n_parallel):
+        start(k)
+    
+    while np.any(games >= 0):
+        active = np.flatnonzero(games >= 0)
+        actions0 = act0(states[active])
+        actions1 = act1(other_states[active]) if act1 is not None else None
+        if batch_env is not None: # Idle games are stepped along with the others, their results are dropped
+            codes0 = np.zeros(n_parallel, dtype=np.int64)
+            codes0[active] = actions0
+            codes1 = None
+            if actions1 is not None:
+                codes1 = np.zeros(n_parallel, dtype=np.int64)
+                codes1[active] = actions1
+            state, reward, done, info = batch_env.step(codes0, codes1)
+            next_states, rewards, dones, next_other_states = state[active], reward[active], done[active], info['otherObs'][active]
+        else:
+            next_states = np.zeros((len(active), state_space))
+            next_other_states = np.zeros((len(active), state_space))
+            rewards = np.zeros(len(active))
+            dones = np.zeros(len(active), dtype=np.bool_)
+            for j, k in enumerate(active):
+                if actions1 is None:
+                    next_states[j], rewards[j], dones[j], info = envs[k].step(action_inverse(actions0[j]))
+                else:
+                    next_states[j], rewards[j], dones[j], info = envs[k].step(action_inverse(actions0[j]), action_inverse(actions1[j]))
+                next_other_states[j] = info['otherObs']
+        scores[games[active]] += rewards
+        states[active] = next_states
+        other_states[active] = next_other_states
+        for k in active[dones]:
+            start(k)
+    return scores
+
+def elo_ratings(wins, games, iterations=200):
+    """
+    Bradley-Terry maximum likelihood ratings on the Elo scale, mean 1000
+    wins[i, j] counts games i won against j (draws as half), games[i, j] games played between them
+    One virtual draw between each pair keeps ratings finite for unbeaten or winless players
+    """
+    n = len(wins)
+    off_diagonal = 1 - np.eye(n)
+    wins = wins + 0.5 * off_diagonal
+    games = games + off_diagonal
+    strength = np.ones(n)
+    for _ in range(iterations): # Minorization-maximization, Hunter 2004
+        strength = wins.sum(axis=1) / (games / (strength[:, None] + strength[None, :])).sum(axis=1)
+        strength /= np.exp(np.mean(np.log(strength)))
+    return 1000 + 400 * np.log10(strength)
+
+def round_robin(policies, n_games=100, init_seed=123, n_parallel=None, make_env=None):
+    """
+    Every pair of policies plays n_games, policies maps names to anything play_games accepts
+    Returns names, mean score and win rate matrices (row against column, draws count half) and Elo ratings
+    """
+    names = list(policies)
+    n = len(names)
+    score = np.zeros((n, n))
+    wins = np.zeros((n, n))
+    games = np.zeros((n, n))
+    for i in range(n):
+        for j in range(i + 1, n):
+            results = play_games(policies[names[i]], policies[names[j]], n_games, init_seed, n_parallel, make_env)
+            score[i, j], score[j, i] = results.mean(), -results.mean()
+            wins[i, j] = np.sum(results > 0) + 0.5 * np.sum(results == 0)
+            wins[j, i] = n_games - wins[i, j]
+            games[i, j] = games[j, i] = n_games
+    win_rate = np.divide(wins, games, out=np.full((n, n), np.nan), where=games > 0)
+    return {'names': names, 'score': score, 'win_rate': win_rate, 'elo': elo_ratings(wins, games)}
+
+def print_tournament(result):
+    names = result['names']
+    width = max(len(name) for name in names) + 2
+    print(' ' * width + ''.join(f'{name:>{width}}' for name in names) + f'{"Elo":>{width}}')
+    for i, name in enumerate(names):
+        row = ''.join(f'{rate:>{width}.2f}' if i != j else f'{"-":>{width}}' for j, rate in enumerate(result['win_rate'][i]))
+        print(f'{name:<{width}}' + row + f'{result["elo"][i]:>{width}.0f}')
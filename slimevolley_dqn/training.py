@@ -0,0 +1,550 @@
+"""# Training"""
+
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .actors import ActorLearner
+from .agent import DQN
+from .backends import make_env, seed, selfplay, set_seeds, simulator
+from .checkpointing import Checkpointer
+from .evaluation import EvalPool, evaluate_bestmodel, evaluate_interim, print_evaluation
+from .export import collect_states, export_policy
+from .inference import greedy_actions
+from .instrumentation import CsvSink, JsonlSink, format_profile
+from .metrics import EpisodeLog, rolling_stats
+from .opponents import OpponentPool
+from .tournament import play_games
+from .utils import action_inverse
+from .wrappers import FrameSkipStack, wrap_env
+
+"""## Train 1 episode"""
+
+def train_one_episode(env, agent, selfplay_mode=False):
+    """
+    Run one episode of training, i.e. until done=True, to collect experience and learn from replay.
+    """
+    
+    #trainer = 'random' # Uncomment this to train against weak opponent
+    trainer = 'expert' # Train against baseline policy in slimevolleygym
+    
+    if selfplay_mode:
+        env.sample_opponent() # Opponent for this episode from the pool of past best models
+    
+    state = env.reset()
+    state = np.reshape(state, (1, -1))
+
+    score = 0
+    done = False
+    step_before = agent.step
+
+    while not done: # Within an episode
+
+        agent.step += 1
+
+        with agent.profiler.phase('inference'):
+            action = agent.act(state) # epsilon
+        
+        with agent.profiler.phase('env'):
+            if selfplay_mode:
+                # Train aginst on best model in the past
+                next_state, reward, done, _ = env.step(action_inverse(action), action_inverse(env.predict(state)))
+            else:
+                if trainer == "random": # Train using random, rookie
+                    next_state, reward, done, _ = env.step(action_inverse(action), action_inverse(agent.act_random()))
+                else: # Train using baseline, i.e. expert
+                    next_state, reward, done, _ = env.step(action_inverse(action))
+    
+        score += reward
+
+        next_state = np.reshape(next_state, (1, -1))
+
+        # Update replay memory
+        agent.update_replay_memory(state, action, reward, next_state, done)
+
+        # Train network every k step
+        if agent.step % agent.training_interval == 0:
+            agent.replay()
+
+        # Update current state
+        state = next_state
+
+        # Update target model after certain timesteps
+        if agent.step % agent.update_target_model_freq == 0:
+            print(f'Target network update at step {agent.step}, epsilon {agent.epsilon}')
+            agent.update_target_model()
+            
+    episode_return = score
+    episode_length = agent.step - step_before
+    
+    return episode_return, episode_length
+
+"""## Train with N envs in lockstep"""
+
+class VecCollector:
+    """
+    Steps copies of the env in lockstep, one batched forward pass selects the actions of all envs
+    Envs are reset independently when done, transitions are pushed to replay as one block
+    envs is a list of envs or a BatchSlimeVolleyEnv, which steps all games with one call
+    """
+    def __init__(self, envs, agent, selfplay_mode=False):
+        self.envs = envs
+        self.agent = agent
+        self.selfplay_mode = selfplay_mode
+        self.batched = isinstance(envs, simulator.BatchSlimeVolleyEnv)
+        self.n_envs = len(envs)
+        if agent.memory.stride != self.n_envs:
+            raise ValueError(f'Agent replay memory expects {agent.memory.stride} envs, got {self.n_envs}, create the DQN with n_envs={self.n_envs}')
+        
+        self.states = np.zeros((self.n_envs, agent.state_space), dtype=np.float32)
+        self.other_states = np.zeros_like(self.states) # Observation in opponent perspective
+        self.scores = np.zeros(self.n_envs)
+        self.lengths = np.zeros(self.n_envs, dtype=np.int64)
+        for i in range(self.n_envs):
+            self.reset_env(i)
+
+    def reset_env(self, i):
+        """Start a new episode in env i, partial episode is discarded"""
+        if self.batched:
+            if self.selfplay_mode:
+                self.envs.sample_opponent(i)
+            self.states[i] = self.envs.reset(i)
+        else:
+            if self.selfplay_mode:
+                self.envs[i].sample_opponent()
+            self.states[i] = self.envs[i].reset()
+        self.other_states[i] = self.states[i]
+        self.scores[i] = 0
+        self.lengths[i] = 0
+
+    def step(self):
+        """
+        Advance every env by one step and learn from replay
+        Return list of (episode_return, episode_length) of episodes finished in this step
+        """
+        agent = self.agent
+        step_before = agent.step
+        agent.step += self.n_envs
+        
+        with agent.profiler.phase('inference'):
+            actions = agent.act_batch(self.states) # epsilon
+            if self.selfplay_mode:
+                opponent_actions = self.opponent_actions()
+        
+        next_states = np.zeros_like(self.states)
+        rewards = np.zeros(self.n_envs, dtype=np.float32)
+        dones = np.zeros(self.n_envs, dtype=np.bool_)
+        with agent.profiler.phase('env'):
+            if self.batched:
+                next_states[:], rewards[:], dones[:], info = self.envs.step(actions, opponent_actions if self.selfplay_mode else None)
+                self.other_states[:] = info['otherObs']
+            else:
+                for i, env in enumerate(self.envs):
+                    if self.selfplay_mode:
+                        # Train aginst on best model in the past
+                        next_states[i], rewards[i], dones[i], info = env.step(action_inverse(actions[i]), action_inverse(opponent_actions[i]))
+                    else: # Train using baseline, i.e. expert
+                        next_states[i], rewards[i], dones[i], info = env.step(action_inverse(actions[i]))
+                    self.other_states[i] = info['otherObs']
+        
+        # Update replay memory
+        agent.update_replay_memory_batch(self.states, actions, rewards, next_states, dones)
+        
+        self.scores += rewards
+        self.lengths += 1
+        self.states = next_states
+        
+        finished = []
+        for i in np.flatnonzero(dones):
+            finished.append((self.scores[i], int(self.lengths[i])))
+            self.reset_env(i)
+        
+        # Train network every k step, step counter moves n_envs at a time
+        for _ in range(agent.step // agent.training_interval - step_before // agent.training_interval):
+            agent.replay()
+        
+        # Update target model after certain timesteps
+        if agent.step // agent.update_target_model_freq > step_before // agent.update_target_model_freq:
+            print(f'Target network update at step {agent.step}, epsilon {agent.epsilon}')
+            agent.update_target_model()
+        
+        return finished
+
+    def opponent_actions(self):
+        """Selfplay opponent actions, one batched forward pass per distinct opponent model"""
+        if self.batched:
+            return self.envs.predict(self.other_states)
+        actions = np.zeros(self.n_envs, dtype=np.int64)
+        groups = OrderedDict()
+        for i, env in enumerate(self.envs):
+            groups.setdefault(id(env.best_model), []).append(i)
+        for idx in groups.values():
+            opponent = self.envs[idx[0]].best_model
+            if opponent is None:
+                actions[idx] = [self.envs[i].predict(None) for i in idx] # Random policy
+            else:
+                actions[idx] = greedy_actions(opponent, self.other_states[idx])
+        return actions
+
+    def collect_episodes(self):
+        """Step all envs until at least one episode is done"""
+        finished = []
+        while not finished:
+            finished = self.step()
+        return finished
+
+    def set_best_model(self, model):
+        if self.batched:
+            self.envs.set_best_model(model)
+            return
+        for env in self.envs:
+            env.best_model = model
+
+"""## Train N episodes"""
+
+def train(env,
+          agent,
+          max_steps,
+          eval_freq,
+          eval_episodes,
+          best_threshold=0,
+          selfplay_mode=False,
+          render_mode=False,
+          eval_env=None,
+          eval_pool=None,
+          collector=None,
+          logdir="dqn_test/",
+          checkpointer=None,
+          gate_games=0):
+
+    """
+    Function to train for N steps, wrapper of train_one_episode
+    Input: agent, steps to train, eval variables, modes
+    env may be a list of envs or a BatchSlimeVolleyEnv, which are then stepped in lockstep by VecCollector,
+    a separate eval_env is required in that case so evaluation does not cut training episodes
+    A collector such as ActorLearner can also be passed in, env is then only used for evaluation
+    With an EvalPool, interim evaluation runs asynchronously while training continues,
+    selfplay examination runs in parallel on the pool but waits for the result
+    With a Checkpointer, the training state is saved every checkpointer.interval steps
+    and new best models are written in the background
+    gate_games > 0 decides selfplay promotion on that many batched games (play_games) instead of eval_episodes rollouts
+    """
+    
+    # Initialize
+    scores = []
+    episode = len(agent.episode_scores) # Continues the episode count of a resumed agent
+    pending_eval = None # Running asynchronous interim evaluation
+    
+    if isinstance(env, (list, tuple, simulator.BatchSlimeVolleyEnv)):
+        if eval_env is None:
+            raise ValueError('eval_env is required when training on a list of envs')
+        collector = VecCollector(env if isinstance(env, simulator.BatchSlimeVolleyEnv) else list(env), agent, selfplay_mode)
+        env = eval_env
+    
+    # Set True to print status, lengthens computation
+    debug = False
+    
+    while agent.step <= max_steps:
+    
+        if collector is None:
+            finished = [train_one_episode(env, agent, selfplay_mode)]
+        else:
+            finished = collector.collect_episodes()
+        
+        for episode_score, episode_length in finished:
+            
+            episode += 1
+            
+            if debug:
+                print(f'CHECK: complete episode: {episode}, agg steps:{agent.step}, length: {episode_length}, score: {episode_score}')
+        
+            agent.episode_lengths.append(episode_length)
+            agent.episode_scores.append(episode_score)
+            mean, std = rolling_stats(agent.episode_scores[-100:], 100)
+            agent.scores_ma100.append(mean[-1])
+            agent.scores_ma100_up.append(mean[-1] + std[-1])
+            agent.scores_ma100_lo.append(mean[-1] - std[-1])
+            if agent.episode_log is not None:
+                agent.episode_log.append(episode, episode_score, episode_length, agent.step, agent.epsilon)
+        
+            if episode % 20 == 0:
+                # This score affected by randomness in epsilon
+                print(f'PROGRESS: episode: {episode}, step: {agent.step}, {round(agent.step/max_steps, 3)}, epsilon: {agent.epsilon}')
+                print(f'PROGRESS: past 20 episode: avg training score: {round(np.mean(agent.episode_scores[-30:]), 3)}, sd: {round(np.std(agent.episode_scores[-30:]), 3)}')
+                print(f'PROFILE: {format_profile(agent.profiler.report(agent.step))}')
+
+        
+            if pending_eval is not None and pending_eval.ready():
+                print_evaluation(pending_eval.label + f' (step {pending_eval.step})', pending_eval.get())
+                pending_eval = None
+        
+            if (episode % eval_freq == 0) and not selfplay_mode: # Evaluate agent performance at interval
+                # Evaluate against random policy to track progress
+                with agent.profiler.phase('eval'):
+                    if eval_pool is None:
+                        evaluate_interim(env, agent, n_trials=eval_episodes, render_mode=render_mode)
+                    else:
+                        if pending_eval is not None: # Previous evaluation still running, wait for it
+                            print_evaluation(pending_eval.label + f' (step {pending_eval.step})', pending_eval.get())
+                        pending_eval = eval_pool.submit('random', agent.model, n_trials=eval_episodes, label='INTERIM', step=agent.step)
+        
+
+            # NOT DEBUG YET
+            # Examine agent with best model to determine if it can become new best model
+            # Examine every 30 episode, meaning agent train against same best model during this interval
+            if selfplay_mode and (episode % eval_freq == 0): 
+                env.use_latest_opponent() # Examine against the latest best model, not a sampled one
+                with agent.profiler.phase('eval'):
+                    if gate_games > 0:
+                        make_gate_env = None # Batched simulator, gym envs when the agent needs the wrapper
+                        if isinstance(env, FrameSkipStack):
+                            make_gate_env = lambda: FrameSkipStack(make_env(), env.frame_skip, env.n_stack)
+                        scores = play_games(agent, env.best_model if env.best_model is not None else 'random', gate_games,
+                                            make_env=make_gate_env)
+                    else:
+                        scores = evaluate_bestmodel(env, agent, n_trials=eval_episodes, pool=eval_pool)
+                print(f'SELFPLAY-exam: mean_reward achieved: {np.mean(scores)} at step {agent.step}')
+                if np.mean(scores) > best_threshold:
+                    filename = logdir + agent.agent_name + '_history_step' + str(agent.step)
+                    if env.opponent_pool is None:
+                        env.opponent_pool = OpponentPool(agent.state_space, agent.action_space, dueling=agent.dueling)
+                    filename += '.npz' if env.opponent_pool.export_dtype is not None else '.keras'
+                    print(f'SELFPLAY: new best model save to {filename}')
+                    # Frozen copy, the opponent does not change while the agent keeps training
+                    _, snapshot = env.opponent_pool.add(filename, agent.model)
+                    with agent.profiler.phase('checkpoint'):
+                        if checkpointer is None:
+                            snapshot.model.save(filename) # Name the best model after time step
+                        else:
+                            checkpointer.save_model(snapshot.model, filename)
+                    env.use_latest_opponent() # Update the env best model to current agent
+                    if collector is not None: # The float weights just promoted, env.best_model may be a NumpyPolicy export
+                        collector.set_best_model(agent.model)
+            
+            if checkpointer is not None:
+                with agent.profiler.phase('checkpoint'):
+                    checkpointer.maybe_save(agent)
+
+    if pending_eval is not None:
+        print_evaluation(pending_eval.label + f' (step {pending_eval.step})', pending_eval.get())
+
+    return agent # Return agent
+
+"""## Run_training"""
+
+HELD_OUT_SEED = 2**31 # First env seed of the held-out states an export is checked on
+
+# Parameters of run_training, keyword arguments of run_training override them
+TRAINING_DEFAULTS = {
+    'seed': seed, # Agent i plays evaluation games with env seed + i, its training envs get seeds above seed + N
+    'agent_name': 'dqn_selfplay', # Agent i is named agent_name + str(i) in the filenames
+    # Number of env copies stepped in lockstep, 1 keeps the single env training loop
+    'n_envs': 1,
+    'batched_env': False, # Step the n_envs games with the NumPy simulator BatchSlimeVolleyEnv instead of n_envs gym envs
+    # Agent decisions, steps and replay count repeated actions once, max_steps included
+    'frame_skip': 1, # Each action is repeated for this many env steps
+    'n_stack': 1, # The agent sees the last n_stack observations
+    # DQN hyperparameters
+    'epsilon_decay': 0.9995,
+    'discount_rate': 0.95,
+    'learning_rate': 0.0001,
+    'min_step_to_learn': 10000,
+    'replay_memory': 10000,
+    'target_update_interval': 1000, # Steps
+    'training_interval': 10, # Steps
+    # Sample replay proportional to TD error instead of uniformly
+    'prioritized_replay': False,
+    'memmap_replay': False, # Keep replay in np.memmap files in logdir instead of RAM, for buffers larger than RAM
+    'double_dqn': False, # Select the next action with the online network, evaluate it with the target network
+    'n_step': 1, # Replay n-step returns, credit for the sparse point rewards reaches earlier steps in fewer updates
+    'dueling': False, # Separate value and advantage streams
+    # Throughput mode, larger batch_size and gradient_steps trade sample efficiency for wall clock time
+    'batch_size': 32,
+    'gradient_steps': 1, # Updates per replay call, minibatches split from one sampled block
+    'lr_scaling': None, # 'linear' or 'sqrt' scales the learning rate with batch_size / 32
+    'epsilon_scaling': False, # Decay epsilon per sampled transition, so exploration does not depend on batch_size
+    # Actor processes collecting experience into shared replay while this process learns
+    # 0 collects experience in the training process, replaces n_envs when set
+    'n_actors': 0,
+    'weight_sync_interval': 10, # Learner updates between weight publications to the actors
+    
+    # Evaluation variables
+    # Agent will be evaluated by multiple greedy rollouts against random policy during training
+    'eval_freq': 20, # Evaluate interval (episode) during training, also for selfplay examination
+    'eval_episodes': 5, # Number of rollouts for each evaluation
+    'eval_workers': 0, # Processes for parallel evaluation, 0 evaluates in the training process
+    'eval_export_dtype': None, # e.g. 'float32', the evaluation workers run NumpyPolicy copies of the networks and never import TF
+    'render_mode': False,
+    'profile_format': None, # 'jsonl' or 'csv' to log the per phase timing of each agent in logdir
+    
+    # Self play parameters
+    'best_threshold': 0.5, # Must achieve a mean score above this to replace prev best self
+    'gate_games': 0, # Batched games for that check, e.g. 200, 0 uses eval_episodes single rollouts
+    'opponent_cache_size': 8, # Frozen past best models kept in memory, others reload from logdir
+    'opponent_latest_prob': 0.5, # Chance to train against the latest best model, else a random past best
+    'opponent_from_logdir': False, # Also sample the best models saved in logdir by earlier runs
+    # 'float16' or 'int8': selfplay opponents run as NumPy policies and are saved as .npz instead of keras models,
+    # the final model is also exported as .npz after checking its greedy actions on held-out states
+    'export_dtype': None,
+    'export_min_agreement': 0.99, # The final export is not written if fewer greedy actions agree, e.g. a degraded int8 export
+    
+    'checkpoint_interval': 10000, # Steps between saves of the full training state, including replay
+    'checkpoint_keep': 3, # Newest checkpoints kept per agent, older ones are deleted
+}
+
+def run_training(selfplay_mode=False, N=5, max_steps=50000, logdir="dqn_test/", resume=False, **options):
+    """
+    Function to carry out training loop.
+    Parameters to be changed in TRAINING_DEFAULTS, or passed as keyword arguments, e.g. run_training(n_envs=8, dueling=True)
+    resume=True continues each agent from its newest checkpoint in logdir
+    Returns the trained agents
+    """
+    unknown = sorted(set(options) - set(TRAINING_DEFAULTS))
+    if unknown:
+        raise TypeError(f'run_training() got unexpected options {unknown}')
+    options = dict(TRAINING_DEFAULTS, **options)
+    seed = options['seed']
+    set_seeds(seed)
+    
+    # Training variable
+    # Repeat training N times using different seeds
+    N = N
+    # Training steps limit
+    max_steps = max_steps # int(3e6)
+    n_envs = options['n_envs']
+    batched_env = options['batched_env']
+    frame_skip = options['frame_skip']
+    n_stack = options['n_stack']
+    n_actors = options['n_actors']
+    
+    # Evaluation variables
+    eval_freq = options['eval_freq']
+    eval_episodes = options['eval_episodes']
+    eval_workers = options['eval_workers']
+    render_mode = options['render_mode']
+    profile_format = options['profile_format']
+    
+    # Self play parameters
+    selfplay_mode = selfplay_mode
+    best_threshold = options['best_threshold']
+    gate_games = options['gate_games']
+    dueling = options['dueling']
+    export_dtype = options['export_dtype']
+
+    LOGDIR = logdir # Directory for saving interim and final models
+    
+    # Stores training result
+    trained_agents = []
+    
+    # Initialize environment
+    opponent_pool = None
+    if selfplay_mode:
+        opponent_pool = OpponentPool(state_space=12 * n_stack, action_space=8, max_cached=options['opponent_cache_size'],
+                                     latest_prob=options['opponent_latest_prob'], dueling=dueling, export_dtype=export_dtype)
+        if options['opponent_from_logdir'] or resume:
+            opponent_pool.add_checkpoints(LOGDIR)
+    
+    def new_env():
+        if selfplay_mode:
+            env = selfplay.SlimeVolleySelfPlayEnv(opponent_pool) # All envs share the history of best models
+        else:
+            env = make_env()
+        return wrap_env(env, frame_skip, n_stack)
+    
+    env = new_env()
+    if batched_env:
+        if frame_skip > 1 or n_stack > 1:
+            raise ValueError('frame_skip and n_stack wrap gym envs, set batched_env = False')
+        train_envs = simulator.BatchSlimeVolleySelfPlayEnv(n_envs, opponent_pool) if selfplay_mode else simulator.BatchSlimeVolleyEnv(n_envs)
+    else:
+        train_envs = [new_env() for _ in range(n_envs)] if n_envs > 1 else env
+    eval_pool = EvalPool(eval_workers, selfplay_mode, 12 * n_stack, dueling=dueling, frame_skip=frame_skip, n_stack=n_stack,
+                         export_dtype=options['eval_export_dtype']) if eval_workers > 0 else None
+
+    try: # The evaluation workers, actors and checkpoint writers are closed also when training fails
+        for i in range(N): # Train agent with N different env seeds
+
+            env.seed(seed + i)
+            train_seeds = [seed + N * (j + 1) + i for j in range(n_envs)] # Distinct from the evaluation env seeds
+            if batched_env:
+                for j, train_seed in enumerate(train_seeds):
+                    train_envs.seed(train_seed, j)
+            elif n_envs > 1:
+                for e, train_seed in zip(train_envs, train_seeds):
+                    e.seed(train_seed)
+        
+            # Create agent
+            agent_name = options['agent_name'] + str(i) # Agent name for filenaming
+            agent = DQN(agent_name=agent_name, 
+                        state_space=env.observation_space.shape[0],
+                        action_space=2**env.action_space.shape[0],
+                        epsilon_decay=options['epsilon_decay'],
+                        discount_rate=options['discount_rate'],
+                        learning_rate=options['learning_rate'],
+                        min_step_to_learn=options['min_step_to_learn'],
+                        replay_memory=options['replay_memory'],
+                        batch_size=options['batch_size'],
+                        target_update_interval=options['target_update_interval'],
+                        training_interval=options['training_interval'],
+                        n_envs=n_envs,
+                        prioritized_replay=options['prioritized_replay'],
+                        replay_directory=LOGDIR + agent_name + '_replay' if options['memmap_replay'] else None,
+                        double_dqn=options['double_dqn'],
+                        dueling=dueling,
+                        gradient_steps=options['gradient_steps'],
+                        lr_scaling=options['lr_scaling'],
+                        epsilon_scaling=options['epsilon_scaling'],
+                        n_step=options['n_step'])
+            if profile_format == 'jsonl':
+                agent.profiler.sink = JsonlSink(LOGDIR + agent_name + '_profile.jsonl')
+            elif profile_format == 'csv':
+                agent.profiler.sink = CsvSink(LOGDIR + agent_name + '_profile.csv')
+        
+            with Checkpointer(LOGDIR, agent_name, options['checkpoint_interval'], options['checkpoint_keep']) as checkpointer:
+                if resume:
+                    restored_step = checkpointer.restore(agent)
+                    if restored_step is not None:
+                        print(f'Resuming agent {agent_name} from step {restored_step}')
+                agent.episode_log = EpisodeLog(LOGDIR + agent_name + '_episodes')
+                agent.episode_log.truncate(len(agent.episode_scores)) # Episodes after the checkpoint are played again
+
+                start_time = time.process_time()
+        
+                if n_actors > 0:
+                    with ActorLearner(agent, n_actors, selfplay_mode, options['weight_sync_interval'], seed=seed + N * (i + 1),
+                                      frame_skip=frame_skip, n_stack=n_stack) as collector:
+                        train_output = train(env, agent, max_steps, eval_freq, eval_episodes, best_threshold, selfplay_mode, render_mode,
+                                             eval_pool=eval_pool, collector=collector, logdir=LOGDIR, checkpointer=checkpointer,
+                                             gate_games=gate_games)
+                else:
+                    train_output = train(train_envs, agent, max_steps, eval_freq, eval_episodes, best_threshold, selfplay_mode, render_mode,
+                                         eval_env=env if train_envs is not env else None, eval_pool=eval_pool, logdir=LOGDIR, checkpointer=checkpointer,
+                                         gate_games=gate_games)
+        
+                end_time = time.process_time()
+                print(f'Training for agent {agent_name} completed. Elapsed time: {end_time - start_time}')
+        
+                trained_agents.append(train_output)
+        
+                # Save final model
+                filename = LOGDIR + agent.agent_name + '_final_step' + str(agent.step)
+                with agent.profiler.phase('checkpoint'):
+                    checkpointer.save(agent)
+                    checkpointer.save_model(agent.model, filename + '.keras') # Name the best model after time step
+                    checkpointer.close() # Wait for the writes, the agent is not trained further
+                if export_dtype is not None:
+                    # Episodes seeded from 2**31 up, no training, actor or evaluation env gets a seed that high
+                    states = collect_states(wrap_env(make_env(), frame_skip, n_stack), agent, init_seed=HELD_OUT_SEED + 10000 * i)
+                    try:
+                        _, agreement = export_policy(agent.model, filename + '.npz', export_dtype, states, options['export_min_agreement'])
+                        print(f'Exported {filename}.npz, greedy actions agree on {agreement:.1%} of {len(states)} held-out states')
+                    except ValueError as e: # The keras model is saved, the other agents still train
+                        print(f'EXPORT: {e}')
+                agent.episode_log.close()
+                agent.profiler.report(agent.step)
+    finally:
+        if eval_pool is not None:
+            eval_pool.close()
+        
+    return trained_agents
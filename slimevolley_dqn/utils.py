@@ -0,0 +1,71 @@
+"""
+# Functions
+## function to map encoded actio to env action
+"""
+
+import numpy as np
+
+def action_inverse(num):
+    """
+    Map multibinary action space to 8 exclusive discrete action combinations
+    """
+    if num == 0:
+        return np.array([0,0,0])
+    elif num == 1:
+        return np.array([1,0,0])
+    elif num == 2:
+        return np.array([0,1,0])
+    elif num == 3:
+        return np.array([0,0,1])
+    elif num == 4:
+        return np.array([1,1,0])
+    elif num == 5:
+        return np.array([1,0,1])
+    elif num == 6:
+        return np.array([0,1,1])
+    elif num == 7:
+        return np.array([1,1,1])
+
+"""## State discretization"""
+
+# Observation range and bins used by the discretized slimevolley experiments
+SLIMEVOLLEY_OBS_LOW = np.array([0., 0., -1.75, -1.296, -2.35, 0., -5.7745, -5.5662, 0., 0., -1.75, -1.296])
+SLIMEVOLLEY_OBS_HIGH = np.array([2.25, 0.4827, 1.75, 1.35, 2.35, 2.0985, 5.6985, 5.805, 2.25, 0.4827, 1.75, 1.35])
+SLIMEVOLLEY_BINS = [20, 10, 10, 10, 50, 50, 30, 30, 20, 10, 10, 10]
+
+class Discretizer:
+    """
+    Map observations to bin coordinates 0...bins-1, bin k covers (low + k*width, low + (k+1)*width]
+    Observations at or below low get low_bin, -1 keeps them apart from the first bin, 0 merges them
+    Widths are computed once, clipping and binning work on a single observation or a batch
+    """
+    def __init__(self, low, high, bins, low_bin=-1):
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.bins = np.asarray(bins, dtype=np.int64)
+        self.low_bin = low_bin
+        self.inv_width = self.bins / (self.high - self.low)
+        
+        # Mixed radix place values for encode, one int64 per observation
+        self.shift = -min(low_bin, 0)
+        sizes = self.bins + self.shift
+        if np.prod(sizes.astype(np.float64)) >= 2**63:
+            raise ValueError(f'{np.prod(sizes.astype(np.float64))} discrete states do not fit an int64 code')
+        self.sizes = sizes
+        self.radix = np.concatenate([[1], np.cumprod(sizes[:-1])])
+
+    def bin_index(self, obs):
+        coordinate = np.ceil((np.clip(obs, self.low, self.high) - self.low) * self.inv_width) - 1
+        return np.clip(coordinate, self.low_bin, self.bins - 1).astype(np.int64) # Upper clip guards rounding at high
+
+    def __call__(self, obs):
+        """Bin coordinates as float32, same shape as obs, drop-in for the network input"""
+        return self.bin_index(obs).astype(np.float32)
+
+    def encode(self, obs):
+        """Single int64 code per observation, suitable for hashing and compact replay storage"""
+        return (self.bin_index(obs) + self.shift) @ self.radix
+
+    def decode(self, codes):
+        """Bin coordinates of encoded observations"""
+        return ((np.asarray(codes)[..., None] // self.radix) % self.sizes - self.shift).astype(np.float32)
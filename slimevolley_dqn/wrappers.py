@@ -0,0 +1,79 @@
+"""# Frame skip and observation stacking"""
+
+import numpy as np
+
+from .backends import spaces
+
+class RollingStack:
+    """
+    The last n rows pushed, oldest first, in a preallocated array
+    Each row is written twice, n rows apart, so the window is always one contiguous slice
+    """
+    def __init__(self, n, size):
+        self.n = n
+        self.rows = np.zeros((2 * n, size))
+        self.pos = 0
+
+    def fill(self, row):
+        self.rows[:] = row
+        self.pos = 0
+
+    def push(self, row):
+        self.pos = (self.pos + 1) % self.n
+        self.rows[self.pos] = row
+        self.rows[self.pos + self.n] = row
+
+    def get(self):
+        return self.rows[self.pos + 1:self.pos + 1 + self.n].reshape(-1).copy()
+
+class FrameSkipStack:
+    """
+    Env wrapper repeating each action frame_skip times, rewards are summed and the repeat stops early on done
+    The observation is the last n_stack observations side by side, oldest first, and info['otherObs'] is stacked
+    the same way for the opponent, a new episode starts with n_stack copies of the first observation
+    Works for the single player env and SlimeVolleySelfPlayEnv, other attributes are read from and written to
+    the wrapped env, so best_model and opponent_pool can be set through the wrapper
+    """
+    _attributes = ('env', 'frame_skip', 'n_stack', 'observation_space', 'stack', 'other_stack')
+
+    def __init__(self, env, frame_skip=1, n_stack=1):
+        self.env = env
+        self.frame_skip = frame_skip
+        self.n_stack = n_stack
+        space = env.observation_space
+        self.observation_space = spaces.Box(np.tile(space.low, n_stack), np.tile(space.high, n_stack))
+        self.stack = RollingStack(n_stack, space.shape[0])
+        self.other_stack = RollingStack(n_stack, space.shape[0])
+
+    def __getattr__(self, name):
+        return getattr(self.env, name)
+
+    def __setattr__(self, name, value):
+        if name in self._attributes:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.env, name, value)
+
+    def reset(self):
+        state = self.env.reset()
+        self.stack.fill(state)
+        self.other_stack.fill(state) # Same first observation for the opponent, as the rollouts use
+        return self.stack.get()
+
+    def step(self, *actions):
+        total_reward = 0
+        for _ in range(self.frame_skip):
+            state, reward, done, info = self.env.step(*actions)
+            total_reward += reward
+            if done:
+                break
+        self.stack.push(state)
+        self.other_stack.push(info['otherObs'])
+        info = dict(info, otherObs=self.other_stack.get())
+        return self.stack.get(), total_reward, done, info
+
+def wrap_env(env, frame_skip=1, n_stack=1):
+    """FrameSkipStack around env, or env itself when both options are off"""
+    if frame_skip == 1 and n_stack == 1:
+        return env
+    return FrameSkipStack(env, frame_skip, n_stack)
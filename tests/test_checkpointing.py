@@ -0,0 +1,61 @@
+"""Checkpointer round trip, a restored agent continues training exactly like the saved one"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from slimevolley_dqn.agent import DQN
+from slimevolley_dqn.checkpointing import Checkpointer
+
+def make_agent(**options):
+    return DQN('test', state_space=12, action_space=8, epsilon_decay=0.99, discount_rate=0.95, learning_rate=0.001,
+               min_step_to_learn=32, replay_memory=200, batch_size=16, target_update_interval=100, training_interval=1,
+               **options)
+
+def play(agent, rng, steps):
+    """Random transitions with a replay update after each, the last one ends the episode"""
+    for i in range(steps):
+        done = rng.random() < 0.05 or i == steps - 1 # A restore marks the pending transitions done
+        agent.update_replay_memory(rng.random(12), rng.integers(8), rng.random(), rng.random(12), done)
+        agent.step += 1
+        agent.replay()
+
+def assert_same_arrays(expected, actual):
+    assert len(expected) == len(actual)
+    for a, b in zip(expected, actual):
+        np.testing.assert_array_equal(np.asarray(a), np.asarray(b))
+
+@pytest.mark.parametrize('memmap', [False, True])
+def test_save_restore(tmp_path, memmap):
+    np.random.seed(0)
+    rng = np.random.default_rng(0)
+    agent = make_agent(replay_directory=str(tmp_path / 'replay') if memmap else None)
+    play(agent, rng, 300) # Past the replay capacity, the ring buffer has wrapped
+    checkpointer = Checkpointer(str(tmp_path) + '/', 'test', interval=100)
+    checkpointer.save(agent)
+    checkpointer.close()
+    
+    restored = make_agent(replay_directory=str(tmp_path / 'restored') if memmap else None)
+    assert Checkpointer(str(tmp_path) + '/', 'test').restore(restored) == agent.step
+    assert restored.epsilon == agent.epsilon
+    assert_same_arrays(agent.model.get_weights(), restored.model.get_weights())
+    assert_same_arrays(agent.target_model.get_weights(), restored.target_model.get_weights())
+    assert_same_arrays([v.numpy() for v in agent.model.optimizer.variables],
+                       [v.numpy() for v in restored.model.optimizer.variables])
+    counters, restored_counters = agent.memory.checkpoint_state()[0], restored.memory.checkpoint_state()[0]
+    if memmap: # The file copy leaves out the oldest block, which the learner may have been overwriting
+        assert counters['size'] - agent.memory.stride - agent.memory.lookahead <= restored_counters['size'] < counters['size']
+        restored_counters['size'] = counters['size']
+    assert counters == restored_counters
+    for name, column in agent.memory.columns().items():
+        np.testing.assert_array_equal(column, restored.memory.columns()[name])
+    
+    if memmap:
+        return # Its read-ahead thread sampled the next minibatch of agent before the save
+    # The restore also set the NumPy RNG, both agents sample the same minibatches from here
+    state = np.random.get_state()
+    play(restored, np.random.default_rng(1), 20)
+    np.random.set_state(state)
+    play(agent, np.random.default_rng(1), 20)
+    assert_same_arrays(agent.model.get_weights(), restored.model.get_weights())
@@ -0,0 +1,210 @@
+"""Replay memory indexing against a brute force list of the added transitions"""
+
+from itertools import islice
+
+import numpy as np
+import pytest
+
+from slimevolley_dqn.replay import MemmapReplayMemory, NStepBuffer, PrioritizedReplayMemory, ReplayMemory, SumTree
+
+def make_memory(cls, capacity, stride, tmp_path, **options):
+    if cls is MemmapReplayMemory:
+        return MemmapReplayMemory(capacity, 2, str(tmp_path / 'replay'), stride=stride, prefetch=False, **options)
+    return cls(capacity, 2, stride=stride, **options)
+
+def episodes(rng, stride):
+    """
+    Endless blocks of random transitions, one per env, state (env, t) is unique per env and t jumps at an episode end
+    """
+    t = np.zeros(stride)
+    while True:
+        states = np.stack([np.arange(stride), t], axis=1)
+        dones = rng.random(stride) < 0.1
+        yield states, rng.integers(0, 8, stride), rng.standard_normal(stride).astype(np.float32), states + [0, 1], dones
+        t = np.where(dones, t + 1000, t + 1)
+
+def play(memory, blocks, steps):
+    """Add steps blocks, returns the transitions in add order as (state, action, reward, next state, done)"""
+    transitions = []
+    for block in islice(blocks, steps):
+        memory.add_batch(*block)
+        transitions.extend(zip(*block))
+    return transitions
+
+def valid_slots(memory):
+    """Slots of the sampleable transitions, oldest first"""
+    n_valid = memory.n_valid()
+    return (memory.ptr - n_valid + np.arange(n_valid)) % memory.capacity
+
+def assert_matches(memory, transitions):
+    """The valid slots hold the newest transitions, next states only matter if not done"""
+    idx = valid_slots(memory)
+    assert len(idx) == min(len(transitions), memory.capacity - memory.lookahead)
+    states, actions, rewards, next_states, dones = memory.get(idx)
+    for k, (state, action, reward, next_state, done) in enumerate(transitions[len(transitions) - len(idx):]):
+        np.testing.assert_array_equal(states[k], state)
+        assert actions[k] == action and rewards[k] == reward and dones[k] == done
+        if not done:
+            np.testing.assert_array_equal(next_states[k], next_state)
+
+@pytest.mark.parametrize('cls', [ReplayMemory, MemmapReplayMemory])
+@pytest.mark.parametrize('stride, capacity', [(1, 1000), (1, 37), (3, 1000), (3, 40), (4, 64)])
+def test_ring_buffer(tmp_path, cls, stride, capacity):
+    rng = np.random.default_rng(0)
+    memory = make_memory(cls, capacity, stride, tmp_path)
+    assert memory.capacity % stride == 0
+    blocks = episodes(rng, stride)
+    transitions = []
+    for steps in (1, 5, 30, 100): # Before and after wrapping around
+        transitions += play(memory, blocks, steps)
+        assert len(memory) == min(len(transitions), memory.capacity)
+        assert memory.n_added == len(transitions)
+        assert_matches(memory, transitions)
+
+    np.random.seed(0)
+    idx = memory.sample_indices(5000)
+    assert set(idx.tolist()) == set(valid_slots(memory).tolist())
+    if cls is MemmapReplayMemory:
+        memory.close()
+
+def test_add_batch_checks_stride():
+    memory = ReplayMemory(100, 2, stride=3)
+    with pytest.raises(ValueError):
+        memory.add_batch(np.zeros((2, 2)), [0, 0], [0, 0], np.zeros((2, 2)), [False, False])
+
+@pytest.mark.parametrize('stride, capacity, steps', [(1, 50, 7), (1, 50, 80), (3, 60, 4), (3, 60, 19), (3, 60, 40)])
+def test_written_since(stride, capacity, steps):
+    """Every slot changed by the adds lies in the ranges of written_since"""
+    rng = np.random.default_rng(1)
+    memory = ReplayMemory(capacity, 2, stride=stride)
+    blocks = episodes(rng, stride)
+    play(memory, blocks, 30)
+    n_added = memory.n_added
+    before = {name: column.copy() for name, column in memory.columns().items()}
+    play(memory, blocks, steps)
+
+    written = np.zeros(memory.capacity, dtype=np.bool_)
+    for block in memory.written_since(n_added):
+        written[block] = True
+    assert written.sum() == min(memory.n_added - n_added + memory.lookahead, memory.capacity)
+    for name, column in memory.columns().items():
+        changed = column != before[name]
+        if changed.ndim > 1:
+            changed = changed.any(axis=1)
+        assert not np.any(changed & ~written), name
+
+@pytest.mark.parametrize('stride, guard', [(1, 0), (1, 10), (4, 12)])
+def test_memmap_guard(tmp_path, stride, guard):
+    """Read-ahead sampling skips the pending block and the guard slots after it"""
+    rng = np.random.default_rng(2)
+    memory = make_memory(MemmapReplayMemory, 200, stride, tmp_path, guard=guard)
+    transitions = play(memory, episodes(rng, stride), 400 // stride)
+    assert_matches(memory, transitions)
+    idx = memory.sample_indices(5000)
+    assert np.all(idx[:-1] <= idx[1:]) # Sorted for reading in file order
+    skipped = (memory.ptr + np.arange(memory.lookahead + memory.guard)) % memory.capacity
+    assert set(idx.tolist()) == set(range(memory.capacity)) - set(skipped.tolist())
+    memory.close()
+
+@pytest.mark.parametrize('capacity', [1, 5, 64, 100])
+def test_sum_tree(capacity):
+    """Totals and prefix sum lookups against np.cumsum"""
+    rng = np.random.default_rng(3)
+    tree = SumTree(capacity)
+    priorities = np.zeros(capacity)
+    for _ in range(20):
+        idx = rng.integers(0, capacity, rng.integers(1, 10))
+        values = rng.random(len(idx)) * (rng.random(len(idx)) < 0.8) # Some leaves back to zero
+        tree.update(idx, values)
+        priorities[idx] = values # Like the tree, the last of duplicate indices wins
+        assert tree.total == pytest.approx(priorities.sum())
+        np.testing.assert_array_equal(tree.get(np.arange(capacity)), priorities)
+        if priorities.sum() > 0:
+            cumsum = np.cumsum(priorities)
+            values = rng.random(200) * cumsum[-1]
+            np.testing.assert_array_equal(tree.find(values), np.searchsorted(cumsum, values))
+
+@pytest.mark.parametrize('stride, capacity, n_step', [(1, 37, 1), (1, 1000, 1), (3, 40, 1), (4, 64, 3)])
+def test_prioritized_slots(stride, capacity, n_step):
+    """Only the valid slots have priorities, the pending next state blocks are never sampled"""
+    rng = np.random.default_rng(4)
+    memory = PrioritizedReplayMemory(capacity, 2, stride=stride, n_step=n_step)
+    blocks = episodes(rng, stride)
+    np.random.seed(0)
+    for steps in (1, 5, 30, 100):
+        play(memory, blocks, steps)
+        valid = np.zeros(memory.capacity, dtype=np.bool_)
+        valid[valid_slots(memory)] = True
+        np.testing.assert_array_equal(memory.tree.get(np.arange(memory.capacity)) > 0, valid)
+        idx = memory.sample_indices(500)
+        assert np.all(valid[idx])
+        memory.update_priorities(idx, rng.standard_normal(len(idx)))
+
+def test_prioritized_sampling():
+    """Sample frequencies follow p^alpha, importance weights are (N P)^-beta scaled to a maximum of 1"""
+    rng = np.random.default_rng(5)
+    memory = PrioritizedReplayMemory(101, 2, alpha=0.5, beta=0.4, beta_steps=10)
+    play(memory, episodes(rng, 1), 200)
+    idx = valid_slots(memory)
+    memory.update_priorities(idx, rng.random(len(idx)) * 10)
+    probs = memory.tree.get(idx) / memory.tree.total
+    assert probs.sum() == pytest.approx(1)
+
+    np.random.seed(0)
+    counts = np.zeros(memory.capacity)
+    for _ in range(10):
+        np.add.at(counts, memory.sample_indices(10000), 1)
+    np.testing.assert_allclose(counts[idx] / counts.sum(), probs, atol=0.003)
+
+    weights = memory.importance_weights(idx)
+    expected = (len(idx) * probs) ** -memory.beta
+    np.testing.assert_allclose(weights, expected / expected.max(), rtol=1e-5)
+    assert memory.beta == 1.0 # Annealed over beta_steps sample calls
+
+def n_step_transitions(steps, n_step, gamma):
+    """Brute force n-step transitions of one env by state, None for the last steps whose window never filled"""
+    expected = {}
+    for i, (state, action, _, _, _) in enumerate(steps):
+        if i + n_step > len(steps) and not any(done for *_, done in steps[i:]):
+            continue
+        ret, done = 0.0, False
+        for k, (_, _, reward, next_state, done) in enumerate(steps[i:i + n_step]):
+            ret += gamma ** k * reward
+            if done:
+                break
+        expected[tuple(state)] = (action, ret, next_state, done)
+    return expected
+
+@pytest.mark.parametrize('cls', [ReplayMemory, PrioritizedReplayMemory])
+@pytest.mark.parametrize('n_step, stride, capacity', [(1, 1, 1000), (3, 1, 1000), (3, 1, 97), (5, 1, 50), (1, 3, 30),
+                                                      (3, 4, 1000), (3, 4, 64), (4, 3, 30)])
+def test_n_step(cls, n_step, stride, capacity):
+    """NStepBuffer into the replay, every valid slot holds the brute force n-step return and next state"""
+    gamma = 0.9
+    rng = np.random.default_rng(6)
+    memory = cls(capacity, 2, stride=stride, n_step=n_step)
+    buffer = NStepBuffer(n_step, gamma, 2, stride)
+    steps = [[] for _ in range(stride)]
+    for states, actions, rewards, next_states, dones in islice(episodes(rng, stride), 400):
+        for j in range(stride):
+            steps[j].append((states[j], actions[j], rewards[j], next_states[j], dones[j]))
+        if stride == 1: # The single env path flushes the window at a done
+            for transition in buffer.push(states[0], actions[0], rewards[0], next_states[0], dones[0]):
+                memory.add(*transition)
+        else:
+            transitions = buffer.push_batch(states, actions, rewards, next_states, dones)
+            if transitions is not None:
+                memory.add_batch(*transitions)
+
+    expected = {}
+    for env_steps in steps:
+        expected.update(n_step_transitions(env_steps, n_step, gamma))
+    idx = valid_slots(memory)
+    assert len(idx) == min(memory.n_added, memory.capacity - memory.lookahead)
+    states, actions, rewards, next_states, dones = memory.get(idx)
+    for k in range(len(idx)):
+        action, ret, next_state, done = expected[tuple(states[k])]
+        assert actions[k] == action and dones[k] == done
+        assert rewards[k] == pytest.approx(ret, abs=1e-5)
+        if not done:
+            np.testing.assert_array_equal(next_states[k], next_state)
@@ -0,0 +1,14 @@
+"""BatchSlimeVolleyEnv against the reference slimevolleygym env, see check_simulator.py for longer runs"""
+
+import pytest
+
+pytest.importorskip('slimevolleygym')
+
+from check_simulator import check
+
+@pytest.mark.parametrize('opponent, seed', [('baseline', 1), ('random', 2)])
+def test_parity(opponent, seed):
+    """Same observations, rewards, dones and info every step, across several finished episodes"""
+    episodes = check(n_games=4, steps=1500, seed=seed, opponent=opponent, atol=1e-9)
+    assert episodes is not None, 'mismatch, printed above'
+    assert episodes > 0